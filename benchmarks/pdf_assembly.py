@@ -0,0 +1,141 @@
+"""
+Compares the two PDF assembly paths on synthetic images.
+
+- fpdf:   one FPDF document per page written as temp_{start}.pdf, merged with PdfMerger.
+- stream: images decoded in a pool, every page written once by StreamingPdfWriter.
+
+Each case runs in a fresh process so peak memory is measured per case:
+
+    python benchmarks/pdf_assembly.py --pages 100 1000 10000
+"""
+import os
+import sys
+import functools
+import argparse
+import json
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from PIL import Image, ImageDraw  # noqa: E402
+from cli import load_settings, default_config_path  # noqa: E402
+from helpers import (  # noqa: E402
+    iter_chunks,
+    generate_pdf_for_pages,
+    merge_temp_pdfs,
+    prepare_page_images,
+    write_pdf_page,
+)
+from pdf_writer import StreamingPdfWriter  # noqa: E402
+
+
+def make_synthetic_images(directory, count, size, seed=0):
+    """Writes count distinct RGBA PNGs that look roughly like pymol renders on a transparent background."""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        img = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(img)
+        points = [(rng.randrange(size), rng.randrange(size)) for _ in range(40)]
+        draw.line(points, fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256), 255), width=max(2, size // 40))
+        path = os.path.join(directory, f"synthetic_{i:06d}.png")
+        img.save(path)
+        paths.append(path)
+    return paths
+
+
+def page_image_lists(image_paths, pages, images_per_page):
+    total = pages * images_per_page
+    return list(iter_chunks((image_paths[i % len(image_paths)] for i in range(total)), images_per_page))
+
+
+def assemble_with_fpdf(pages, temp_directory, output_pdf_path, SETTINGS):
+    images_per_page = len(pages[0])
+    with Pool() as pool:
+        temp_pdf_paths = pool.starmap(generate_pdf_for_pages, [
+            (i * images_per_page, (i + 1) * images_per_page, page, temp_directory, SETTINGS) for i, page in enumerate(pages)
+        ])
+    merge_temp_pdfs(temp_pdf_paths, output_pdf_path)
+
+
+def assemble_with_stream(pages, temp_directory, output_pdf_path, SETTINGS):
+    with Pool() as pool, StreamingPdfWriter(output_pdf_path,
+                                            orientation=SETTINGS["pdf_settings"]["orientation"],
+                                            unit=SETTINGS["pdf_settings"]["unit"],
+                                            format=SETTINGS["pdf_settings"]["format"]) as writer:
+        for page, prepared_images in zip(pages, pool.imap(functools.partial(prepare_page_images, SETTINGS=SETTINGS), pages)):
+            write_pdf_page(writer, page, prepared_images, SETTINGS)
+
+
+ENGINES = {"fpdf": assemble_with_fpdf, "stream": assemble_with_stream}
+
+
+def run_one(engine, pages, image_directory, SETTINGS):
+    """Runs a single case in this process and returns its measurements."""
+    image_paths = sorted(os.path.join(image_directory, name) for name in os.listdir(image_directory))
+    images_per_page = SETTINGS["grid"]["columns"] * SETTINGS["grid"]["rows"]
+    page_lists = page_image_lists(image_paths, pages, images_per_page)
+    with tempfile.TemporaryDirectory() as temp_directory:
+        output_pdf_path = os.path.join(temp_directory, "benchmark.pdf")
+        start = time.perf_counter()
+        ENGINES[engine](page_lists, temp_directory, output_pdf_path, SETTINGS)
+        seconds = time.perf_counter() - start
+        size = os.path.getsize(output_pdf_path)
+    # ru_maxrss is in KiB on Linux.
+    peak_rss_mb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                      resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+    return {"engine": engine, "pages": pages, "seconds": seconds, "pdf_mb": size / 1024 ** 2, "peak_rss_mb": peak_rss_mb}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-page FPDF + PdfMerger against the streaming PDF writer.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 1000, 10000], help="Page counts to benchmark.")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES), help="Assembly paths to compare.")
+    parser.add_argument("--grid", type=int, nargs=2, default=None, metavar=("COLUMNS", "ROWS"), help="Grid per page (default from config).")
+    parser.add_argument("--image_size", type=int, default=250, help="Width and height of the synthetic images in pixels.")
+    parser.add_argument("--distinct_images", type=int, default=2000, help="Number of distinct synthetic images, reused cyclically across pages.")
+    parser.add_argument("--config", type=str, default=default_config_path, help="Settings to lay out pages with.")
+    parser.add_argument("--output", type=str, default=None, help="Write the results as JSON to this file.")
+    parser.add_argument("--run_one", nargs=3, metavar=("ENGINE", "PAGES", "IMAGE_DIRECTORY"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    SETTINGS = load_settings(args.config)
+    if args.grid:
+        SETTINGS["grid"]["columns"], SETTINGS["grid"]["rows"] = args.grid
+
+    if args.run_one:
+        engine, pages, image_directory = args.run_one
+        print(json.dumps(run_one(engine, int(pages), image_directory, SETTINGS)))
+        return
+
+    image_directory = tempfile.mkdtemp(prefix="pdf_assembly_images_")
+    try:
+        make_synthetic_images(image_directory, args.distinct_images, args.image_size)
+        results = []
+        for pages in args.pages:
+            for engine in args.engines:
+                command = [sys.executable, os.path.abspath(__file__), "--config", args.config,
+                           "--run_one", engine, str(pages), image_directory]
+                if args.grid:
+                    command += ["--grid", *map(str, args.grid)]
+                output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                results.append(result)
+                print(f"{engine:>6} {pages:>6} pages: {result['seconds']:8.1f} s, "
+                      f"{result['pdf_mb']:8.1f} MB PDF, peak RSS {result['peak_rss_mb']:7.1f} MB")
+    finally:
+        shutil.rmtree(image_directory)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Measures the per-structure latency of generate_image_from_pdb.
+
+Renders every PDB in a folder sequentially in one process (no pool, no cache),
+so the numbers reflect pymol load, styling, image and session writes only.
+Run it on two commits to compare before/after:
+
+    python benchmarks/render_latency.py --input_folder examples/ --repeats 3
+"""
+import os
+import sys
+import argparse
+import statistics
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from cli import load_settings, default_config_path  # noqa: E402
+from helpers import list_all_pdb_files  # noqa: E402
+from pdb_to_png import configure_pymol_cmd, generate_image_from_pdb  # noqa: E402
+
+
+def measure_render_latency(pdb_files, SETTINGS, output_directory, repeats):
+    latencies = []
+    for _ in range(repeats):
+        for pdb_file in pdb_files:
+            image_file = os.path.join(output_directory, os.path.splitext(os.path.basename(pdb_file))[0] + ".png")
+            start = time.perf_counter()
+            generate_image_from_pdb(pdb_file, image_file, SETTINGS)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-structure render latency of generate_image_from_pdb.")
+    parser.add_argument("--input_folder", type=str, required=True, help="Folder with PDB files to render.")
+    parser.add_argument("--config", type=str, default=default_config_path, help="Settings to render with.")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of passes over the PDB files.")
+    args = parser.parse_args()
+
+    SETTINGS = load_settings(args.config)
+    configure_pymol_cmd(SETTINGS)
+    pdb_files = sorted(list_all_pdb_files(args.input_folder))
+
+    with tempfile.TemporaryDirectory() as output_directory:
+        # Warm up pymol so the first structure does not pay for initialisation.
+        generate_image_from_pdb(pdb_files[0], os.path.join(output_directory, "warmup.png"), SETTINGS)
+        latencies = measure_render_latency(pdb_files, SETTINGS, output_directory, args.repeats)
+
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    print(f"{len(latencies_ms)} renders of {len(pdb_files)} structures")
+    print(f"mean {statistics.mean(latencies_ms):.1f} ms, median {statistics.median(latencies_ms):.1f} ms, "
+          f"p95 {latencies_ms[int(0.95 * (len(latencies_ms) - 1))]:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
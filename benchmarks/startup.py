@@ -0,0 +1,84 @@
+"""
+Measures the cold start of protein_visualiser.py.
+
+Every repeat starts a fresh interpreter, so the numbers include the imports, the
+license lookup and, for the trivial run, one pymol worker rendering one small
+synthetic structure:
+
+- help:    protein_visualiser.py --help
+- trivial: a run over one structure with a 1x1 grid, no render cache and no metrics
+
+The slowest imports of each case are listed from python -X importtime.
+Run it on two commits to compare before/after:
+
+    python benchmarks/startup.py --repeats 10
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+import tempfile
+import time
+
+benchmarks_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, benchmarks_directory)
+
+from synthetic import make_structures  # noqa: E402
+
+script_path = os.path.join(benchmarks_directory, os.pardir, "src", "protein_visualiser.py")
+
+
+def startup_cases(work_directory):
+    """Returns the arguments of every case."""
+    input_folder = os.path.join(work_directory, "structures")
+    make_structures(input_folder, [500])
+    return {
+        "help": ["--help"],
+        "trivial": ["--input_folder", input_folder, "--output_directory", os.path.join(work_directory, "out"), "--grid", "1", "1",
+                    "--num_files", "0", "--processes", "1", "--no_render_cache", "--no_metrics"],
+    }
+
+
+def measure_cold_start(arguments, repeats):
+    """Wall times in seconds of repeats fresh runs of protein_visualiser.py with arguments."""
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script_path, *arguments], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def slowest_imports(arguments, top):
+    """The top modules by cumulative import time (ms), from python -X importtime."""
+    result = subprocess.run([sys.executable, "-X", "importtime", script_path, *arguments],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, module = line[len("import time:"):].split("|")
+        # Only top-level imports, nested ones are included in their parent's time
+        if not module.startswith("  "):
+            imports.append((int(cumulative_us) / 1000, module.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold start of protein_visualiser.py for --help and a trivial run.")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh runs per case.")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest imports to list per case.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="pymol_grid_startup_") as work_directory:
+        for name, arguments in startup_cases(work_directory).items():
+            measure_cold_start(arguments, 1)  # warm the OS file cache, so every repeat measures the same thing
+            seconds = measure_cold_start(arguments, args.repeats)
+            print(f"{name:8s} median {1000 * statistics.median(seconds):7.0f} ms, min {1000 * min(seconds):7.0f} ms ({args.repeats} runs)")
+            for cumulative_ms, module in slowest_imports(arguments, args.top):
+                print(f"           import {module:24s} {cumulative_ms:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Benchmark suite for the discovery, render and layout hot paths, on synthetic inputs.
+
+Runs offline on a CPU-only machine. Every stage is measured on its own:
+
+- discovery: iter_structure_files over a synthetic tree, without and with a discovery index.
+- render:    structures of several atom counts through the worker pool, for each process count
+             (throughput per core and latency per atom count).
+- layout:    decoding and writing pages with the streaming writer, FPDF pages and their merge.
+
+With --renderer stub, pymol is replaced by a PIL stub that only reads the PDB and draws a PNG,
+so the layout and I/O stages can be benchmarked without the cost of pymol.
+
+Results are saved per commit and can be compared:
+
+    python benchmarks/suite.py run
+    python benchmarks/suite.py run --renderer stub --stages render layout
+    python benchmarks/suite.py compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+"""
+import os
+import sys
+import argparse
+import datetime
+import io
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from PIL import Image, ImageDraw  # noqa: E402
+import helpers  # noqa: E402
+from cli import load_settings, default_config_path  # noqa: E402
+from helpers import (  # noqa: E402
+    iter_chunks,
+    generate_pdf_for_pages,
+    merge_temp_pdfs,
+    prepare_page_images,
+    write_pdf_page,
+)
+from discovery import iter_structure_files  # noqa: E402
+from pdf_writer import StreamingPdfWriter  # noqa: E402
+from worker_pool import create_render_pool, imap_render  # noqa: E402
+from synthetic import make_pdb_tree, make_structures  # noqa: E402
+
+
+benchmarks_directory = os.path.dirname(os.path.abspath(__file__))
+STAGES = ("discovery", "render", "layout")
+
+
+def stub_generate_image_from_pdb(pdb_path, output_path, SETTINGS, timings=None):
+    """Stands in for pdb_to_png.generate_image_from_pdb: reads the atoms and draws their x/y projection with PIL."""
+    start = time.perf_counter()
+    with open(pdb_path, "r") as f:
+        coordinates = [(float(line[30:38]), float(line[38:46])) for line in f if line.startswith("ATOM")]
+    loaded = time.perf_counter()
+
+    width, height = SETTINGS["image_dimensions"]["width"], SETTINGS["image_dimensions"]["height"]
+    img = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    min_x, max_x = min(x for x, _ in coordinates), max(x for x, _ in coordinates)
+    min_y, max_y = min(y for _, y in coordinates), max(y for _, y in coordinates)
+    scale = 0.9 * min(width, height) / max(max_x - min_x, max_y - min_y, 1)
+    points = [((x - min_x) * scale + 0.05 * width, (y - min_y) * scale + 0.05 * height) for x, y in coordinates]
+    ImageDraw.Draw(img).line(points, fill=(70, 130, 180, 255), width=2)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    png_data = buffer.getvalue()
+    rendered = time.perf_counter()
+
+    if output_path is not None:
+        with open(output_path, "wb") as f:
+            f.write(png_data)
+    if timings is not None:
+        timings.update({"load": loaded - start, "style": 0.0, "render": rendered - loaded, "write": time.perf_counter() - rendered})
+    return png_data
+
+
+def git_commit():
+    """Returns the short hash of HEAD, with -dirty if tracked files were modified, or "unknown" outside git."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=benchmarks_directory,
+                                check=True, capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=benchmarks_directory).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def benchmark_discovery(work_directory, args, results):
+    root = os.path.join(work_directory, "tree")
+    directories = make_pdb_tree(root, args.tree_files, args.tree_depth)
+    index_path = os.path.join(work_directory, "discovery_index.json")
+
+    start = time.perf_counter()
+    found = sum(1 for _ in iter_structure_files(root))
+    scan_seconds = time.perf_counter() - start
+
+    # The first indexed walk builds the index, the second one reuses it.
+    list(iter_structure_files(root, index_path=index_path))
+    start = time.perf_counter()
+    sum(1 for _ in iter_structure_files(root, index_path=index_path))
+    indexed_seconds = time.perf_counter() - start
+
+    results["discovery.files"] = found
+    results["discovery.directories"] = directories
+    results["discovery.scan_seconds"] = scan_seconds
+    results["discovery.scan_files_per_second"] = found / scan_seconds
+    results["discovery.indexed_seconds"] = indexed_seconds
+    print(f"discovery: {found} files in {directories} directories, {scan_seconds:.3f} s scan, {indexed_seconds:.3f} s with index")
+
+
+def benchmark_render(work_directory, args, SETTINGS, results):
+    structures_directory = os.path.join(work_directory, "structures")
+    pdb_files = make_structures(structures_directory, args.atom_counts, args.copies)
+    image_paths = []
+    for processes in args.processes:
+        temp_directory = os.path.join(work_directory, f"render_{processes}")
+        os.makedirs(temp_directory, exist_ok=True)
+        SETTINGS["worker_pool"]["processes"] = processes
+        start = time.perf_counter()
+        with create_render_pool(SETTINGS, temp_directory) as pool:
+            rendered = list(imap_render(pool, ((pdb_file, None) for pdb_file in pdb_files), SETTINGS["worker_pool"]["batch_size"]))
+        seconds = time.perf_counter() - start
+        throughput = len(rendered) / seconds
+        results[f"render.p{processes}.structures_per_second"] = throughput
+        results[f"render.p{processes}.structures_per_second_per_core"] = throughput / processes
+        print(f"render: {processes} processes, {throughput:.2f} structures/s ({throughput / processes:.2f} per core)")
+
+        if processes == min(args.processes):
+            image_paths = [result["image_path"] for result in rendered]
+            for atoms in args.atom_counts:
+                latencies = [result["timings"]["total"] for result in rendered
+                             if result["timings"] and f"synthetic_{atoms:07d}_atoms" in result["pdb_file"]]
+                results[f"render.latency_ms.{atoms}_atoms"] = 1000 * statistics.median(latencies)
+                print(f"render: {atoms} atoms, median {1000 * statistics.median(latencies):.0f} ms")
+    return image_paths
+
+
+def benchmark_layout(work_directory, image_paths, args, SETTINGS, results):
+    if not image_paths:
+        # Without the render stage, lay out stub renders of synthetic structures.
+        structures = make_structures(os.path.join(work_directory, "layout_structures"), [2000], copies=8)
+        image_paths = []
+        for pdb_file in structures:
+            image_paths.append(os.path.splitext(pdb_file)[0] + ".png")
+            stub_generate_image_from_pdb(pdb_file, image_paths[-1], SETTINGS)
+
+    images_per_page = SETTINGS["grid"]["columns"] * SETTINGS["grid"]["rows"]
+    pages = list(iter_chunks((image_paths[i % len(image_paths)] for i in range(args.pages * images_per_page)), images_per_page))
+    layout_directory = os.path.join(work_directory, "layout")
+    os.makedirs(layout_directory, exist_ok=True)
+
+    decode_seconds = write_seconds = 0
+    writer = StreamingPdfWriter(os.path.join(layout_directory, "stream.pdf"),
+                                orientation=SETTINGS["pdf_settings"]["orientation"],
+                                unit=SETTINGS["pdf_settings"]["unit"],
+                                format=SETTINGS["pdf_settings"]["format"])
+    for page in pages:
+        start = time.perf_counter()
+        prepared_images = prepare_page_images(page, SETTINGS)
+        decoded = time.perf_counter()
+        write_pdf_page(writer, page, prepared_images, SETTINGS)
+        decode_seconds += decoded - start
+        write_seconds += time.perf_counter() - decoded
+    start = time.perf_counter()
+    writer.close()
+    close_seconds = time.perf_counter() - start
+
+    fpdf_seconds = 0
+    temp_pdf_paths = []
+    for i, page in enumerate(pages):
+        start = time.perf_counter()
+        temp_pdf_paths.append(generate_pdf_for_pages(i * images_per_page, (i + 1) * images_per_page, page, layout_directory, SETTINGS))
+        fpdf_seconds += time.perf_counter() - start
+    start = time.perf_counter()
+    merge_temp_pdfs(temp_pdf_paths, os.path.join(layout_directory, "fpdf.pdf"))
+    merge_seconds = time.perf_counter() - start
+
+    results["layout.stream.decode_ms_per_page"] = 1000 * decode_seconds / len(pages)
+    results["layout.stream.write_ms_per_page"] = 1000 * write_seconds / len(pages)
+    results["layout.stream.close_ms"] = 1000 * close_seconds
+    results["layout.fpdf.page_ms_per_page"] = 1000 * fpdf_seconds / len(pages)
+    results["layout.fpdf.merge_ms"] = 1000 * merge_seconds
+    print(f"layout: stream {1000 * decode_seconds / len(pages):.1f} ms decode + {1000 * write_seconds / len(pages):.1f} ms write per page, "
+          f"fpdf {1000 * fpdf_seconds / len(pages):.1f} ms per page + {1000 * merge_seconds:.0f} ms merge ({len(pages)} pages)")
+
+
+def run(args):
+    SETTINGS = load_settings(args.config)
+    SETTINGS["render_cache"]["enabled"] = False
+    SETTINGS["in_memory_images"]["enabled"] = False
+    SETTINGS["metrics"]["enabled"] = True
+    if args.grid:
+        SETTINGS["grid"]["columns"], SETTINGS["grid"]["rows"] = args.grid
+    if args.renderer == "stub":
+        # Workers are forked, so they inherit the stub.
+        helpers.generate_image_from_pdb = stub_generate_image_from_pdb
+        SETTINGS["worker_pool"]["start_method"] = "fork"
+
+    results = {}
+    work_directory = tempfile.mkdtemp(prefix="pymol_grid_benchmark_")
+    try:
+        image_paths = []
+        if "discovery" in args.stages:
+            benchmark_discovery(work_directory, args, results)
+        if "render" in args.stages:
+            image_paths = benchmark_render(work_directory, args, SETTINGS, results)
+        if "layout" in args.stages:
+            benchmark_layout(work_directory, image_paths, args, SETTINGS, results)
+    finally:
+        shutil.rmtree(work_directory)
+
+    commit = git_commit()
+    record = {
+        "commit": commit,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpu_count": os.cpu_count()},
+        "renderer": args.renderer,
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("func", "output_directory")},
+        "results": results,
+    }
+    os.makedirs(args.output_directory, exist_ok=True)
+    output_path = os.path.join(args.output_directory, f"{commit}_{args.renderer}.json")
+    with open(output_path, "w") as f:
+        json.dump(record, f, indent=4)
+    print(f"Results saved to {output_path}")
+
+
+def compare(args):
+    """Prints every metric of two result files side by side."""
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"{'metric':<50} {old['commit']:>14} {new['commit']:>14} {'change':>8}")
+    for metric in sorted(set(old["results"]) | set(new["results"])):
+        old_value, new_value = old["results"].get(metric), new["results"].get(metric)
+        change = ""
+        if old_value and new_value is not None:
+            change = f"{100 * (new_value - old_value) / old_value:+.1f}%"
+        format_value = lambda value: "-" if value is None else f"{value:.3f}"  # noqa: E731
+        print(f"{metric:<50} {format_value(old_value):>14} {format_value(new_value):>14} {change:>8}")
+    print("Throughput metrics (per_second) are better when higher, times (seconds, ms) when lower.")
+    if old["parameters"] != new["parameters"] or old["machine"] != new["machine"]:
+        print("Note: the two runs used different parameters or machines.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark discovery, rendering and page layout on synthetic inputs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks and save the results for this commit.")
+    run_parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES, help="Stages to benchmark.")
+    run_parser.add_argument("--renderer", choices=("pymol", "stub"), default="pymol", help="Render with pymol or with a PIL stub.")
+    run_parser.add_argument("--tree_files", type=int, default=20000, help="Number of .pdb files in the discovery tree.")
+    run_parser.add_argument("--tree_depth", type=int, default=3, help="Depth of the discovery tree (4 subdirectories per directory).")
+    run_parser.add_argument("--atom_counts", type=int, nargs="+", default=[1000, 5000, 20000, 50000], help="Atom counts of the synthetic structures.")
+    run_parser.add_argument("--copies", type=int, default=4, help="Structures per atom count.")
+    run_parser.add_argument("--processes", type=int, nargs="+", default=sorted({1, os.cpu_count()}), help="Worker process counts to render with.")
+    run_parser.add_argument("--pages", type=int, default=50, help="Pages to lay out.")
+    run_parser.add_argument("--grid", type=int, nargs=2, default=None, metavar=("COLUMNS", "ROWS"), help="Grid per page (default from config).")
+    run_parser.add_argument("--config", type=str, default=default_config_path, help="Settings to render and lay out with.")
+    run_parser.add_argument("--output_directory", type=str, default=os.path.join(benchmarks_directory, "results"), help="Where results are saved.")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two saved results.")
+    compare_parser.add_argument("old", help="Results of the baseline commit.")
+    compare_parser.add_argument("new", help="Results of the commit to compare.")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
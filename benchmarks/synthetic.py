@@ -0,0 +1,82 @@
+"""
+Synthetic inputs for the benchmarks, generated offline and reproducibly from a seed.
+
+- make_pdb_tree: a directory tree of empty .pdb files (and non-matching files) for discovery.
+- make_structure: a PDB file with a given number of atoms, as helical chains.
+"""
+import os
+import math
+import random
+
+
+def make_pdb_tree(root, files, depth, fanout=4, other_files_ratio=0.5, seed=0):
+    """
+    Creates files empty .pdb files spread over a tree of directories depth levels deep,
+    fanout subdirectories per directory, plus other_files_ratio non-matching files (.png, .txt)
+    per .pdb file. Discovery never reads the files, so they stay empty.
+
+    Returns:
+    - int: Number of directories created.
+    """
+    rng = random.Random(seed)
+    directories = [root]
+    level = [root]
+    for _ in range(depth):
+        level = [os.path.join(parent, f"d{i}") for parent in level for i in range(fanout)]
+        directories.extend(level)
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+
+    for i in range(files):
+        directory = rng.choice(directories)
+        open(os.path.join(directory, f"design_{i:07d}.pdb"), "w").close()
+        if rng.random() < other_files_ratio:
+            open(os.path.join(directory, f"design_{i:07d}{rng.choice(['.png', '.txt'])}"), "w").close()
+    return len(directories)
+
+
+def helix_atoms(residues, offset):
+    """Backbone and CB atoms of an ideal alpha helix along z, shifted by offset in x and y."""
+    atoms = []
+    # name, radius (A), phase shift (rad), z shift (A) of each atom relative to the CA of its residue
+    residue_atoms = (("N", 1.6, -0.45, -0.8), ("CA", 2.3, 0.0, 0.0), ("C", 1.7, 0.5, 0.8), ("O", 1.9, 0.8, 1.9), ("CB", 3.3, 0.2, -0.5))
+    for i in range(residues):
+        angle = math.radians(100) * i
+        for name, radius, phase, rise in residue_atoms:
+            x = offset[0] + radius * math.cos(angle + phase)
+            y = offset[1] + radius * math.sin(angle + phase)
+            z = 1.5 * i + rise
+            atoms.append((name, i + 1, x, y, z))
+    return atoms
+
+
+def make_structure(path, atoms, residues_per_chain=400):
+    """Writes a PDB with about atoms atoms as helical chains of up to residues_per_chain alanines, laid out on a grid."""
+    residues = max(1, atoms // 5)
+    chains = math.ceil(residues / residues_per_chain)
+    columns = math.ceil(math.sqrt(chains))
+    serial = 0
+    with open(path, "w") as f:
+        for chain in range(chains):
+            chain_residues = min(residues_per_chain, residues - chain * residues_per_chain)
+            offset = (12.0 * (chain % columns), 12.0 * (chain // columns))
+            chain_id = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[chain % 26]
+            for name, residue, x, y, z in helix_atoms(chain_residues, offset):
+                serial += 1
+                f.write(f"ATOM  {serial % 100000:5d}  {name:<3} ALA {chain_id}{residue % 10000:4d}    "
+                        f"{x:8.3f}{y:8.3f}{z:8.3f}  1.00 90.00           {name[0]}\n")
+            f.write("TER\n")
+        f.write("END\n")
+    return serial
+
+
+def make_structures(directory, atom_counts, copies=1):
+    """Writes copies structures of every size in atom_counts to directory and returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for atoms in atom_counts:
+        for copy in range(copies):
+            path = os.path.join(directory, f"synthetic_{atoms:07d}_atoms_{copy:03d}.pdb")
+            make_structure(path, atoms)
+            paths.append(path)
+    return paths
@@ -0,0 +1,96 @@
+import os
+import glob
+import json
+import argparse
+from functools import lru_cache
+
+
+# Imported by protein_visualiser before anything else. Keep it free of pymol, PIL, fpdf and PyPDF2,
+# so --help and argument errors return without loading them.
+
+# Calculate the script directory once at the module level
+script_directory = os.path.dirname(os.path.abspath(__file__))
+repository_directory = os.path.abspath(os.path.join(script_directory, os.pardir))
+
+# Environment variable with the path of the pymol license file
+LICENSE_ENV_VAR = "PYMOL_LICENSE_FILE"
+
+
+@lru_cache(maxsize=None)
+def find_license_file(configured_path=None):
+    """
+    Returns the path of the pymol license file, or None if there is none.
+
+    Only explicit places are checked, in order: the PYMOL_LICENSE_FILE environment
+    variable, configured_path (the pymol_license_file setting) and a .lic file in the
+    repository root. Directories are never walked, so outputs/ does not slow startup down.
+    """
+    for path in (os.environ.get(LICENSE_ENV_VAR), configured_path):
+        if path:
+            path = os.path.expanduser(path)
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"The pymol license file {path} does not exist.")
+            return path
+    license_files = sorted(glob.glob(os.path.join(glob.escape(repository_directory), "*.lic")))
+    return license_files[0] if license_files else None
+
+
+default_config_path = os.path.join(script_directory, os.pardir, 'config', 'default_settings.json')
+
+
+def merge_settings(defaults, overrides):
+    """Recursively overlays overrides on defaults so older configs pick up newly added settings."""
+    merged = dict(defaults)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_settings(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def load_settings(path):
+    with open(default_config_path, 'r') as f:
+        defaults = json.load(f)
+    with open(path, 'r') as f:
+        return merge_settings(defaults, json.load(f))
+
+def create_arg_parser():
+    parser = argparse.ArgumentParser(description="A protein visualizer tool that generates PDFs from PDB files.")
+    
+    # Create a mutually exclusive group for --input_folder and --input_txt
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument("--input_folder", type=str, help="Path to the parent folder containing PDB files.")
+    input_group.add_argument("--input_txt", type=str, help="Path to a .txt file with paths to PDBs.")
+
+
+    # Optional arguments
+    parser.add_argument("--filename_pattern", type=str, default=None, help="Pattern to match specific PDB files.")
+    parser.add_argument("--discovery_index", type=str, default=None, help="Path to a manifest of the --input_folder tree. Repeat runs only rescan directories that changed.")
+    parser.add_argument("--num_files", type=int, default=None, help="Number of PDB files to visualize. 0 visualizes all matching files.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the random selection of --num_files files, for reproducible runs.")
+    parser.add_argument("--output_filename", type=str, default=None, help="Custom name for the output PDF.")
+    parser.add_argument("--grid", type=int, nargs=2, default=None, metavar=("COLUMNS", "ROWS"), help="Grid dimensions for arranging images in the PDF.")
+    parser.add_argument("--write_filenames", action="store_true", default=None, help="Include the filenames in the output PDF.")
+    parser.add_argument("--sort_pdbs_in_pdf", action='store_true', default=None, help="Sort PDB files alphabetically before adding to the PDF.")
+    parser.add_argument("--processes", type=int, default=None, help="Number of pymol worker processes (default: all cores).")
+    parser.add_argument("--batch_size", type=int, default=None, help="Number of PDB files sent to a pymol worker per job. Only used when worker_pool.supervised is false, supervised workers get one structure at a time.")
+    parser.add_argument("--task_timeout", type=float, default=None, help="Seconds a structure may take to render before its pymol worker is killed and replaced.")
+    parser.add_argument("--max_retries", type=int, default=None, help="How often a structure that timed out, crashed or failed is retried before it is shown as a placeholder.")
+    parser.add_argument("--lod_atom_threshold", type=int, default=None, help="Render structures with more atoms than this with the cheaper level_of_detail settings.")
+    parser.add_argument("--tile_dpi", type=int, default=None, help="Downsample images to the printed size of a grid cell at this DPI before they go into the PDF.")
+    parser.add_argument("--tile_format", type=str, default=None, choices=["png", "jpeg", "palette"], help="Encoding of the images in the PDF: lossless png (default), jpeg or palette.")
+    parser.add_argument("--views", type=str, nargs="+", default=None, help="Render every structure in these views next to each other, e.g. front side top.")
+    parser.add_argument("--in_memory", action="store_true", default=None, help="Hand rendered images to the PDF writer in memory instead of through PNG files.")
+    parser.add_argument("--keep_png", action="store_true", default=None, help="With --in_memory, still write the PNG files.")
+    parser.add_argument("--shard", type=str, default=None, metavar="i/N", help="Render only shard i of N (counting from 0) for a multi-node run. Merge the shards with merge_shards.py.")
+    parser.add_argument("--watch", action="store_true", help="After rendering, keep watching --input_folder and update the PDF as files are added or changed.")
+    parser.add_argument("--debounce", type=float, default=None, help="In watch mode, seconds without further changes before the PDF is updated.")
+    parser.add_argument("--resume", action="store_true", help="Continue the interrupted run with the same arguments from its journal in the _source_files directory.")
+    parser.add_argument("--no_metrics", action="store_true", default=None, help="Do not time the run or write the metrics report.")
+    parser.add_argument("--no_render_cache", action="store_true", default=None, help="Bypass the render cache and re-render every PDB with pymol.")
+
+    default_output_directory = os.path.join(os.path.join(script_directory, os.pardir), 'outputs')
+    parser.add_argument("--output_directory", type=str, default=default_output_directory, help="Path to the directory where the output PDF will be saved.")
+    parser.add_argument("--config", type=str, default=default_config_path, help="Path to custom configuration settings in JSON format.")
+    
+    return parser
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import tarfile
+from structure_io import STRUCTURE_EXTENSIONS, ARCHIVE_EXTENSIONS, is_archive, iter_archive_members
+
+
+# File extensions picked up during discovery: structure files and tar archives of them.
+DISCOVERY_EXTENSIONS = STRUCTURE_EXTENSIONS + ARCHIVE_EXTENSIONS
+
+# Directories modified this recently may still change within the same mtime tick, so they are not trusted next run.
+RACY_MTIME_SECONDS = 2
+
+
+def scan_directory(directory, extensions):
+    """Returns the sorted structure file names and subdirectory names of one directory."""
+    files = []
+    subdirectories = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    # Like os.walk, do not follow symlinked directories.
+                    if not entry.is_symlink():
+                        subdirectories.append(entry.name)
+                elif entry.name.lower().endswith(extensions):
+                    files.append(entry.name)
+            except OSError:
+                continue
+    return sorted(files), sorted(subdirectories)
+
+
+def iter_structure_archive(path):
+    """Yields the members of the archive at path, or nothing if it cannot be read."""
+    try:
+        yield from iter_archive_members(path)
+    except (OSError, tarfile.TarError) as e:
+        print(f"Skipping unreadable archive {path}: {e}")
+
+
+def load_discovery_index(index_path, root_dir, extensions):
+    """Loads the manifest written by a previous run, or an empty one if it is missing or was built for another root or extensions."""
+    if index_path is None or not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if index.get("root") != os.path.abspath(root_dir) or index.get("extensions") != list(extensions):
+        return {}
+    return index.get("directories", {})
+
+
+def save_discovery_index(index_path, root_dir, extensions, directories):
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"root": os.path.abspath(root_dir), "extensions": list(extensions), "directories": directories}, f)
+    os.replace(temp_path, index_path)
+
+
+def iter_structure_files(root_dir, filename_pattern="", extensions=DISCOVERY_EXTENSIONS, index_path=None, expand_archives=True):
+    """
+    Walks root_dir once with os.scandir and yields matching structure files as they are found.
+
+    Files are filtered by extension and by filename_pattern (a substring of the file name)
+    during the walk, and directories are visited in sorted order so the output is the same
+    on every machine. Tar archives are expanded into their structure files
+    (archive::member, see structure_io) in archive order.
+
+    If index_path is given, the listing of every directory is stored there together with
+    the directory mtime. On the next run, directories whose mtime is unchanged are not
+    listed again, so only directories that changed are rescanned. The index is only
+    written again if a listing changed.
+
+    Args:
+    - root_dir (str): Directory to search, including all subdirectories.
+    - filename_pattern (str): Only yield files whose name contains this string.
+    - extensions (Tuple[str]): File extensions to yield.
+    - index_path (str): Optional path of the on-disk manifest.
+    - expand_archives (bool): Yield the structure files in tar archives. If False, the
+      archives themselves are yielded, whatever their members are called.
+
+    Yields:
+    - str: Paths of matching structure files.
+    """
+    filename_pattern = filename_pattern or ""
+    cached_directories = load_discovery_index(index_path, root_dir, extensions)
+    directories = {}
+    now = time.time()
+
+    stack = [""]
+    while stack:
+        relative_directory = stack.pop()
+        directory = os.path.join(root_dir, relative_directory) if relative_directory else root_dir
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            continue
+
+        cached = cached_directories.get(relative_directory)
+        if cached is not None and cached["mtime_ns"] == mtime_ns:
+            files, subdirectories = cached["files"], cached["subdirectories"]
+        else:
+            try:
+                files, subdirectories = scan_directory(directory, extensions)
+            except OSError:
+                continue
+
+        if index_path is not None:
+            trusted_mtime = mtime_ns if now - mtime_ns / 1e9 > RACY_MTIME_SECONDS else None
+            directories[relative_directory] = {"mtime_ns": trusted_mtime, "files": files, "subdirectories": subdirectories}
+
+        for name in files:
+            path = os.path.join(directory, name)
+            if is_archive(name) and not expand_archives:
+                yield path
+            elif is_archive(name):
+                for member_path in iter_structure_archive(path):
+                    if filename_pattern in os.path.basename(member_path):
+                        yield member_path
+            elif filename_pattern in name:
+                yield path
+        stack.extend(os.path.join(relative_directory, name) for name in reversed(subdirectories))
+
+    if index_path is not None and directories != cached_directories:
+        save_discovery_index(index_path, root_dir, extensions, directories)
@@ -1,82 +1,207 @@
 import os
-import concurrent.futures
-import functools
-from PIL import Image
+import io
+import hashlib
+from PIL import Image, ImageDraw
 from fpdf import FPDF
-from PyPDF2 import PdfMerger
-import json
+import random
 import time
-import argparse
 import pymol
-from pdb_to_png import generate_image_from_pdb
+from pdb_to_png import generate_image_from_pdb, generate_view_images_from_pdb, get_views, write_image_file
+from discovery import iter_structure_files
+from cli import LICENSE_ENV_VAR
+from structure_io import STRUCTURE_EXTENSIONS, structure_name, structure_exists, split_member_path, is_archive, is_structure_file, iter_archive_members
+from pdf_writer import prepare_pdf_image, downsample_image, flatten_image
+from render_cache import render_cache_key, view_cache_key, lookup_cached_image, read_cached_image, store_cached_image
 
 
-# Calculate the script directory once at the module level
-script_directory = os.path.dirname(os.path.abspath(__file__))
+def activate_license(license_file_path, quiet=False):
+    """Activates a pymol license file. Also called in every worker, as spawned workers do not inherit it."""
+    if license_file_path is None:
+        return f"No pymol license found. Set {LICENSE_ENV_VAR} or pymol_license_file, or copy the .lic file to the repository root."
+    if not quiet:
+        print(f"Found pymol license at {license_file_path}")
+    pymol.licensing.check_license_file(license_file_path)
+    return pymol.licensing.get_info()
 
 
-def check_license_in_directory():
-    """Search for a .lic file starting one directory up from the helpers.py directory and scanning all subdirectories."""
-    start_directory = os.path.abspath(os.path.join(script_directory, os.pardir))
-    for root, dirs, files in os.walk(start_directory):
-        for file in files:
-            if file.endswith(".lic"):
-                license_file_path = os.path.join(root, file)
-                print(f"Found pymol license at {license_file_path}")
-                pymol.licensing.check_license_file(license_file_path)
-                return pymol.licensing.get_info()
-    return "No .lic file found in the parent directory or its subdirectories."
 
-def load_settings(path):
-    with open(path, 'r') as f:
-        return json.load(f)
-
-def create_arg_parser():
-    parser = argparse.ArgumentParser(description="A protein visualizer tool that generates PDFs from PDB files.")
-    
-    # Create a mutually exclusive group for --input_folder and --input_txt
-    input_group = parser.add_mutually_exclusive_group(required=True)
-    input_group.add_argument("--input_folder", type=str, help="Path to the parent folder containing PDB files.")
-    input_group.add_argument("--input_txt", type=str, help="Path to a .txt file with paths to PDBs.")
-
-
-    # Optional arguments
-    parser.add_argument("--filename_pattern", type=str, default=None, help="Pattern to match specific PDB files.")
-    parser.add_argument("--num_files", type=int, default=None, help="Number of PDB files to visualize.")
-    parser.add_argument("--output_filename", type=str, default=None, help="Custom name for the output PDF.")
-    parser.add_argument("--grid", type=int, nargs=2, default=None, metavar=("COLUMNS", "ROWS"), help="Grid dimensions for arranging images in the PDF.")
-    parser.add_argument("--write_filenames", action="store_true", default=None, help="Include the filenames in the output PDF.")
-    parser.add_argument("--sort_pdbs_in_pdf", action='store_true', default=None, help="Sort PDB files alphabetically before adding to the PDF.")
-
-    default_output_directory = os.path.join(os.path.join(script_directory, os.pardir), 'outputs')
-    parser.add_argument("--output_directory", type=str, default=default_output_directory, help="Path to the directory where the output PDF will be saved.")
-    default_config_path = os.path.join(os.path.join(script_directory, os.pardir), 'config', 'default_settings.json')
-    parser.add_argument("--config", type=str, default=default_config_path, help="Path to custom configuration settings in JSON format.")
-    
-    return parser
+def process_pdb_file(pdb_file, temp_directory, SETTINGS, previous_image_path=None):
+    """
+    Renders pdb_file, reusing the render cache when possible.
 
+    previous_image_path is the image a resumed run already rendered for pdb_file.
+    If it is still on disk it is used instead of rendering again.
 
-def process_pdb_file( pdb_file, temp_directory, SETTINGS):
-    base_name = os.path.basename(pdb_file)
-    image_file = os.path.join(temp_directory, os.path.splitext(base_name)[0] + ".png")
-    generate_image_from_pdb(pdb_file, image_file, SETTINGS) 
-    return image_file
+    By default the image is written as a PNG to temp_directory. With in-memory images
+    the PNG is decoded for the PDF writer right here in the worker, and is only written
+    to temp_directory when in_memory_images.keep_png is set.
 
+    With several views (SETTINGS["views"]), the structure is loaded once and rendered in
+    every view, and image_path and image are lists with one entry per view.
 
+    Returns:
+    - dict: pdb_file, image_path (None if no PNG was written), image (decoded for the
+      PDF writer, None unless in memory), cache_hit, resumed, error (set by the
+      supervised pool for structures that failed to render) and timings (seconds per
+      step and the worker pid, only with metrics enabled).
+    """
+    in_memory = SETTINGS["in_memory_images"]["enabled"]
+    views = get_views(SETTINGS)
+    # Single-view results hold one image, multi-view results a list of them.
+    pack = (lambda values: values) if views else (lambda values: values[0])
+
+    if previous_image_path is not None:
+        previous_image_paths = previous_image_path if views else [previous_image_path]
+        if all(os.path.exists(path) for path in previous_image_paths):
+            image = pack([prepare_tile(path, SETTINGS) for path in previous_image_paths]) if in_memory else None
+            return {"pdb_file": pdb_file, "image_path": previous_image_path, "image": image, "cache_hit": False, "resumed": True, "error": None, "timings": None}
+
+    start = time.perf_counter()
+    timings = {} if SETTINGS["metrics"]["enabled"] else None
+
+    image_files = [None] * max(1, len(views))
+    image_path = None
+    if not in_memory or SETTINGS["in_memory_images"]["keep_png"]:
+        image_files = [os.path.join(temp_directory, name + ".png") for name in tile_file_names(pdb_file, views)]
+        image_path = pack(image_files)
+    result = {"pdb_file": pdb_file, "image_path": image_path, "image": None, "cache_hit": False, "resumed": False, "error": None, "timings": timings}
+
+    png_images = None
+    if SETTINGS["render_cache"]["enabled"]:
+        cache_directory = SETTINGS["render_cache"]["directory"]
+        key = render_cache_key(pdb_file, SETTINGS)
+        keys = [view_cache_key(key, view) for view in views] if views else [key]
+        if not in_memory:
+            result["cache_hit"] = all(lookup_cached_image(cache_directory, key, image_file) for key, image_file in zip(keys, image_files))
+        else:
+            png_images = [read_cached_image(cache_directory, key) for key in keys]
+            if None in png_images:
+                png_images = None
+            result["cache_hit"] = png_images is not None
+            for png_data, image_file in zip(png_images or [], image_files):
+                if image_file is not None:
+                    write_image_file(image_file, png_data)
+    if timings is not None:
+        timings["cache"] = time.perf_counter() - start
+
+    if not result["cache_hit"]:
+        if views:
+            png_images = generate_view_images_from_pdb(pdb_file, image_files, SETTINGS, views, timings)
+        else:
+            png_images = [generate_image_from_pdb(pdb_file, image_files[0], SETTINGS, timings)]
+        if SETTINGS["render_cache"]["enabled"]:
+            for key, png_data in zip(keys, png_images):
+                store_cached_image(cache_directory, key, png_data)
+
+    if in_memory:
+        decode_start = time.perf_counter()
+        result["image"] = pack([prepare_tile(io.BytesIO(png_data), SETTINGS) for png_data in png_images])
+        if timings is not None:
+            timings["decode"] = time.perf_counter() - decode_start
+    if timings is not None:
+        timings["total"] = time.perf_counter() - start
+        timings["worker"] = os.getpid()
+    return result
+
+
+def tile_names(pdb_file, views):
+    """Names of the images of pdb_file: its file name, or its file name and the view name for every view."""
+    name = structure_name(pdb_file)
+    if not views:
+        return [name]
+    return [f"{name}_{view['name']}" for view in views]
+
+
+def tile_file_names(pdb_file, views):
+    """
+    File names (without extension) of the images of pdb_file: its tile names and a short hash of its full path.
 
-def generate_pdf_for_pages(start, end, image_files, temp_directory, SETTINGS):
+    Structures in different folders or archives, or in different formats, can share a
+    name (s1.tar::model_1.pdb and s2.tar::model_1.pdb), but not an image.
+    """
+    path_hash = hashlib.sha1(pdb_file.encode()).hexdigest()[:8]
+    return [f"{name}_{path_hash}" for name in tile_names(pdb_file, views)]
+
+
+def result_tiles(result, SETTINGS):
+    """Returns the (label, image_path, image) of every grid tile of a process_pdb_file result."""
+    views = get_views(SETTINGS)
+    labels = tile_names(result["pdb_file"], views)
+    if not views:
+        return [(labels[0], result["image_path"], result["image"])]
+    image_paths = result["image_path"] if result["image_path"] is not None else [None] * len(views)
+    images = result["image"] if result["image"] is not None else [None] * len(views)
+    return list(zip(labels, image_paths, images))
+
+
+def structures_per_page(SETTINGS):
+    """Number of structures on a page. With several views, the views of a structure share a row, so a row holds columns // views structures."""
+    views = max(1, len(get_views(SETTINGS)))
+    structures_per_row = SETTINGS["grid"]["columns"] // views
+    if structures_per_row < 1:
+        raise ValueError(f"The grid has {SETTINGS['grid']['columns']} columns, too few for {views} views per structure")
+    return structures_per_row * SETTINGS["grid"]["rows"]
+
+
+def tile_cells(structures, SETTINGS):
+    """Grid cell of every tile of the first structures structures on a page, keeping the views of a structure next to each other on one row."""
+    views = max(1, len(get_views(SETTINGS)))
+    columns = SETTINGS["grid"]["columns"]
+    structures_per_row = columns // views
+    return [(structure // structures_per_row) * columns + (structure % structures_per_row) * views + view
+            for structure in range(structures) for view in range(views)]
+
+
+def make_placeholder_png(SETTINGS):
+    """Returns the PNG bytes of the tile shown in place of structures that failed to render: a grey cross on a transparent background."""
+    width, height = SETTINGS["image_dimensions"]["width"], SETTINGS["image_dimensions"]["height"]
+    img = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    line_width = max(2, min(width, height) // 50)
+    margin = min(width, height) // 4
+    draw.line([(margin, margin), (width - margin, height - margin)], fill=(160, 160, 160, 255), width=line_width)
+    draw.line([(margin, height - margin), (width - margin, margin)], fill=(160, 160, 160, 255), width=line_width)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def grid_cell_layout(SETTINGS):
+    """Returns the grid, the cell width and height and the filename font size used on every PDF page."""
     grid = (SETTINGS["grid"]["columns"], SETTINGS["grid"]["rows"])
-    pdf = FPDF(orientation=SETTINGS["pdf_settings"]["orientation"], 
-            unit=SETTINGS["pdf_settings"]["unit"], 
-            format=SETTINGS["pdf_settings"]["format"])
-
     cell_width = (297 - 20) / grid[0]
     cell_height = (210 - 20) / grid[1]
-    images_count = 0
 
     # Calculate the font size based on cell width and clamp between min and max sizes
     font_size = cell_width * 0.15 * SETTINGS["pdf_settings"]["font_size_multiplier"] # Setting font size proportional to cell width
     font_size = max(2, min(font_size, 14))  # Clamping between 4 and 10
+    return grid, cell_width, cell_height, font_size
+
+
+def cell_position(images_count, grid, cell_width, cell_height):
+    """Calculate X and Y position for image placement."""
+    x = 10 + (images_count % grid[0]) * cell_width
+    y = 10 + ((images_count // grid[0]) % grid[1]) * cell_height
+    return x, y
+
+
+def fit_image_in_cell(img_width, img_height, cell_width, cell_height):
+    """Calculate width and height for the image to maintain aspect ratio."""
+    aspect_ratio = img_width / img_height
+    new_width = cell_width
+    new_height = cell_width / aspect_ratio
+    if new_height > cell_height:
+        new_height = cell_height
+        new_width = cell_height * aspect_ratio
+    return new_width, new_height
+
+
+def generate_pdf_for_pages(start, end, image_files, temp_directory, SETTINGS, cells=None, labels=None):
+    pdf = FPDF(orientation=SETTINGS["pdf_settings"]["orientation"], 
+            unit=SETTINGS["pdf_settings"]["unit"], 
+            format=SETTINGS["pdf_settings"]["format"])
+
+    grid, cell_width, cell_height, font_size = grid_cell_layout(SETTINGS)
 
     # Set font and determine base height
     pdf.set_font("Helvetica", size=font_size)  # Changed font to Helvetica
@@ -85,20 +210,16 @@ def generate_pdf_for_pages(start, end, image_files, temp_directory, SETTINGS):
     pdf.set_auto_page_break(auto=True, margin=0)  # reduce line spacing when the text is split
 
     pdf.add_page()  # Add a new page for the current set of images
-    for image_path in image_files:
-        # Calculate X and Y position for image placement.
-        x = 10 + (images_count % grid[0]) * cell_width
-        y = 10 + ((images_count // grid[0]) % grid[1]) * cell_height
+    # cells gives the grid cell of every image when it is not simply the next one (grouped views).
+    cells = cells or range(len(image_files))
+    # Without labels, the label is the name of the rendered image, not of the downsampled tile.
+    labels = labels or [os.path.splitext(os.path.basename(image_path))[0] for image_path in image_files]
+    for image_path, cell, filename in zip(image_files, cells, labels):
+        x, y = cell_position(cell, grid, cell_width, cell_height)
+        image_path = prepare_tile_file(image_path, SETTINGS)
 
-        # Calculate width and height for the image to maintain aspect ratio.
         with Image.open(image_path) as img:
-            img_width, img_height = img.size
-            aspect_ratio = img_width / img_height
-            new_width = cell_width
-            new_height = cell_width / aspect_ratio
-            if new_height > cell_height:
-                new_height = cell_height
-                new_width = cell_height * aspect_ratio
+            new_width, new_height = fit_image_in_cell(*img.size, cell_width, cell_height)
 
         # Add the image to the PDF.
         pdf.image(image_path, x, y, new_width, new_height)
@@ -106,38 +227,113 @@ def generate_pdf_for_pages(start, end, image_files, temp_directory, SETTINGS):
         # If write_filenames is True, write the image filename within the image boundaries at the bottom.
         if SETTINGS["write_filenames"]:
             filename_line_spacing = base_height / 1  # Adjust the filename_space dynamically based on the base_height
-            filename = os.path.splitext(os.path.basename(image_path))[0]
             text_y = y + new_height - filename_line_spacing
             text_width = new_width
             pdf.set_fill_color(255, 255, 255)  # Set background color to white
             pdf.set_xy(x, text_y)
             pdf.multi_cell(text_width, filename_line_spacing, filename, border=0, align='C', fill=True)
 
-
-        images_count += 1
-
     # Save the temporary PDF file with a unique name based on the start index.
     temp_pdf_path = os.path.join(temp_directory, f"temp_{start}.pdf")
     pdf.output(temp_pdf_path, "F")
     return temp_pdf_path
 
 
-def split_images_for_pages(image_files, grid):
-    images_per_page = grid[0] * grid[1]
-    num_pages = len(image_files) // images_per_page
-    if len(image_files) % images_per_page > 0:
-        num_pages += 1  # If there's a remainder, we need an additional page
+def tile_pixel_box(SETTINGS):
+    """
+    The pixel size of a grid cell printed at tile_quality.dpi, which tiles are downsampled
+    to fit in, or None to keep the rendered resolution.
+    """
+    dpi = SETTINGS["tile_quality"]["dpi"]
+    if not dpi:
+        return None
+    _, cell_width, cell_height, _ = grid_cell_layout(SETTINGS)
+    # The grid is laid out in mm
+    return max(1, round(cell_width / 25.4 * dpi)), max(1, round(cell_height / 25.4 * dpi))
 
-    image_splits = []
-    for i in range(num_pages):
-        start = i * images_per_page
-        end = start + images_per_page
-        image_splits.append((start, end, image_files[start:end]))
-    
-    return image_splits
+
+def prepare_tile(source, SETTINGS):
+    """Decodes a rendered image for the streaming PDF writer, downsampled and encoded as set in tile_quality."""
+    tile_quality = SETTINGS["tile_quality"]
+    return prepare_pdf_image(source, tile_pixel_box(SETTINGS), tile_quality["format"], tile_quality["jpeg_quality"], tile_quality["palette_colours"])
+
+
+def prepare_tile_file(image_path, SETTINGS):
+    """
+    The fpdf engine's counterpart of prepare_tile: writes the downsampled and re-encoded tile
+    next to image_path and returns its path, or returns image_path if tile_quality keeps it as is.
+    """
+    tile_quality = SETTINGS["tile_quality"]
+    tile_path = tile_file_path(image_path, SETTINGS)
+    if tile_path == image_path:
+        return image_path
+    with Image.open(image_path) as img:
+        img.load()
+        img = downsample_image(img if img.mode in ("RGBA", "LA", "RGB", "L") else img.convert("RGBA"), tile_pixel_box(SETTINGS))
+    # Failed structures share one placeholder image, whose tile several layout processes may write at once.
+    # Each writes its own file and renames it, so no page embeds a half-written tile.
+    temp_path = f"{tile_path}.{os.getpid()}.tmp"
+    if tile_quality["format"] == "jpeg":
+        flatten_image(img).save(temp_path, "JPEG", quality=tile_quality["jpeg_quality"])
+    elif tile_quality["format"] == "palette":
+        flatten_image(img).convert("RGB").quantize(colors=tile_quality["palette_colours"]).save(temp_path, "PNG")
+    else:
+        img.save(temp_path, "PNG")
+    os.replace(temp_path, tile_path)
+    return tile_path
+
+
+def tile_file_path(image_path, SETTINGS):
+    """Where prepare_tile_file writes the tile of image_path."""
+    if tile_pixel_box(SETTINGS) is None and SETTINGS["tile_quality"]["format"] == "png":
+        return image_path
+    extension = ".jpg" if SETTINGS["tile_quality"]["format"] == "jpeg" else ".png"
+    return os.path.splitext(image_path)[0] + "_tile" + extension
+
+
+def prepare_page_images(image_files, SETTINGS):
+    """Decodes the images of one page for the streaming PDF writer. Runs in the layout pool."""
+    return [prepare_tile(image_path, SETTINGS) for image_path in image_files]
+
+
+def write_pdf_page(writer, pdb_files, prepared_images, SETTINGS, labels=None, cells=None):
+    """
+    Lays out one page on a StreamingPdfWriter with the same grid as generate_pdf_for_pages.
+
+    Images are labelled with their file name unless labels are given, and placed in
+    consecutive grid cells unless cells are given (grouped views).
+    """
+    grid, cell_width, cell_height, font_size = grid_cell_layout(SETTINGS)
+    writer.set_font_size(font_size)
+    filename_line_spacing = writer.get_string_width('A') * 1.5
+
+    labels = labels or [structure_name(pdb_file) for pdb_file in pdb_files]
+    cells = cells or range(len(prepared_images))
+    writer.add_page()
+    for label, image, cell in zip(labels, prepared_images, cells):
+        x, y = cell_position(cell, grid, cell_width, cell_height)
+        new_width, new_height = fit_image_in_cell(image["width"], image["height"], cell_width, cell_height)
+        writer.image(image, x, y, new_width, new_height)
+
+        if SETTINGS["write_filenames"]:
+            writer.text_box(label, x, y + new_height - filename_line_spacing, new_width, filename_line_spacing)
+    writer.end_page()
+
+
+def iter_chunks(items, chunk_size):
+    """Groups an iterator into lists of chunk_size items without materialising it."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 def merge_temp_pdfs(temp_pdf_paths,output_pdf_path):      
-    # Merge all the temporary PDFs into one
+    # Merge all the temporary PDFs into one. PyPDF2 is only needed by the fpdf engine, so it is imported here.
+    from PyPDF2 import PdfMerger
     merger = PdfMerger()
     for pdf in temp_pdf_paths:
         merger.append(pdf)
@@ -156,6 +352,9 @@ def get_pdb_paths_from_file(file_path):
     """
     Extracts and validates PDB paths from a provided .txt file.
 
+    Lines may name .pdb, .pdb.gz, .cif and .cif.gz files, members of tar archives
+    (archive.tar::member.pdb) or whole tar archives, which stand for all their structure files.
+
     Args:
     - file_path (str): Path to the .txt file containing paths to PDBs.
 
@@ -164,15 +363,17 @@ def get_pdb_paths_from_file(file_path):
 
     Raises:
     - FileNotFoundError: If the provided file does not exist.
-    - ValueError: If a line in the file doesn't point to an existing PDB file.
+    - ValueError: If a line in the file doesn't point to an existing structure file or archive.
     """
+    return list(iter_pdb_paths_from_file(file_path))
+
+def iter_pdb_paths_from_file(file_path):
+    """Yields the validated PDB paths of a .txt file one by one. See get_pdb_paths_from_file."""
 
     # Check if the provided file exists
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"The provided file {file_path} does not exist.")
 
-    pdb_paths = []
-
     # Read the file and extract PDB paths
     with open(file_path, 'r') as file:
         for line in file:
@@ -180,42 +381,48 @@ def get_pdb_paths_from_file(file_path):
                 continue
             line = line.strip()  # Remove whitespace and newline characters
             if line:  # Ensure the line is not empty
-                # Validate if it's a valid path and points to a .pdb file
-                if not os.path.exists(line):
+                # Validate if it's a valid path and points to a structure file or archive
+                if not structure_exists(line):
                     raise ValueError(f"The path {line} mentioned in the file does not exist.")
-                elif not line.lower().endswith('.pdb'):
-                    raise ValueError(f"The path {line} does not point to a .pdb file.")
+                elif is_archive(line):
+                    yield from iter_archive_members(line)
+                elif not is_structure_file(split_member_path(line)[1] or line):
+                    raise ValueError(f"The path {line} does not point to a structure file ({', '.join(STRUCTURE_EXTENSIONS)}).")
                 else:
-                    pdb_paths.append(line)
+                    yield line
 
-    return pdb_paths
+def reservoir_sample(items, k, seed=None):
+    """
+    Selects k items uniformly at random from an iterator of unknown length in one pass.
 
-def list_pdb_files_in_directory(directory, filename_pattern=""):
-    """Returns all pdb files in a given directory matching the filename_pattern."""
-    # return [os.path.join(directory, entry.name) for entry in os.scandir(directory) if entry.name.endswith('.pdb') and filename_pattern in os.path.splitext(entry.name)[0]]
-    return [os.path.join(directory, entry.name) for entry in os.scandir(directory) if entry.name.endswith('.pdb')]
+    Only the k selected items are held in memory. The selection depends only on the
+    order of items and the seed, so a fixed seed always gives the same files, in the
+    same order, whether items is a list or a generator.
 
-def list_all_pdb_files(root_dir, filename_pattern=""):
-    directories = []
-    for dirpath, _, _ in os.walk(root_dir):
-        directories.append(dirpath)
-        
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Pass the same filename_pattern to all worker threads
-        partial_func = functools.partial(list_pdb_files_in_directory, filename_pattern=filename_pattern)
-        results = list(executor.map(partial_func, directories))
-    # Flatten list of lists
-    pdbs = [item for sublist in results for item in sublist]
-    return pdbs
-
-def wait_until_all_files_are_present(paths):
-    all_files_present = False
-    while not all_files_present:
-        if all([os.path.exists(image) for image in paths]):
-            all_files_present = True
+    Args:
+    - items (Iterable[str]): Candidate files.
+    - k (int): Number of files to select. None keeps every item.
+    - seed (int): Seed of the random generator. None gives a different selection every run.
+
+    Returns:
+    - Tuple[List[str], int]: Selected files and the number of candidates seen.
+    """
+    rng = random.Random(seed)
+    reservoir = []
+    seen = 0
+    for item in items:
+        if k is None or seen < k:
+            reservoir.append(item)
         else:
-            print("Waiting for all image files to be present...")
-            time.sleep(0.1)
+            j = rng.randrange(seen + 1)
+            if j < k:
+                reservoir[j] = item
+        seen += 1
+    return reservoir, seen
+
+def list_all_pdb_files(root_dir, filename_pattern="", index_path=None):
+    """Returns all pdb files under root_dir matching filename_pattern. See discovery.iter_structure_files."""
+    return list(iter_structure_files(root_dir, filename_pattern, index_path=index_path))
 
 def create_unique_temp_directory(output_directory, path_name, filename_pattern):
     # Create a unique identifier for the temporary directory
@@ -0,0 +1,85 @@
+import os
+import re
+import glob
+import json
+import argparse
+from PyPDF2 import PdfMerger
+from sharding import load_shard_manifest
+
+
+def find_shard_manifests(output_pdf_path):
+    """Returns the manifests of all shards of output_pdf_path, ordered by shard."""
+    base = os.path.splitext(output_pdf_path)[0]
+    # The glob also finds the shards' _metrics.json and _render_errors.json, which are not manifests.
+    manifest_name = re.compile(re.escape(os.path.basename(base)) + r"_shard_\d+_of_\d+\.json$")
+    manifest_paths = [path for path in glob.glob(f"{glob.escape(base)}_shard_*_of_*.json")
+                      if manifest_name.match(os.path.basename(path))]
+    manifests = [(path, load_shard_manifest(path)) for path in manifest_paths]
+    return sorted(manifests, key=lambda item: item[1]["shard"])
+
+
+def check_shard_manifests(manifests):
+    """Raises ValueError unless the manifests are the complete, consistent shards of one run."""
+    if not manifests:
+        raise ValueError("No shard manifests found")
+    first = manifests[0][1]
+    shards = first["shards"]
+    found = [manifest["shard"] for _, manifest in manifests if manifest["shards"] == shards]
+    if found != list(range(shards)) or len(manifests) != shards:
+        raise ValueError(f"Expected shards 0 to {shards - 1} of {shards}, found manifests {[path for path, _ in manifests]}")
+
+    next_page = 0
+    for path, manifest in manifests:
+        for key in ("selection_digest", "settings", "structures", "structures_per_page"):
+            if manifest[key] != first[key]:
+                raise ValueError(f"{path} belongs to a different run: its {key} differs from shard 0")
+        if not manifest["complete"]:
+            raise ValueError(f"Shard {manifest['shard']}/{shards} has not finished (or was interrupted, rerun it with --resume)")
+        if manifest["first_page"] != next_page:
+            raise ValueError(f"Shard {manifest['shard']}/{shards} starts at page {manifest['first_page']}, expected {next_page}")
+        next_page += manifest["pages"]
+    if next_page * first["structures_per_page"] < first["structures"]:
+        raise ValueError(f"The shards cover {next_page} pages, too few for {first['structures']} structures")
+
+
+def merge_shards(output_pdf_path):
+    """
+    Assembles the shard PDFs of a --shard run into output_pdf_path, in page order.
+
+    The shard error reports are combined into <output>_render_errors.json.
+    """
+    manifests = find_shard_manifests(output_pdf_path)
+    check_shard_manifests(manifests)
+
+    merger = PdfMerger()
+    failures = []
+    for path, manifest in manifests:
+        if not manifest["pages"]:
+            continue
+        shard_pdf_path = os.path.join(os.path.dirname(path), manifest["pdf"])
+        merger.append(shard_pdf_path)
+        error_report_path = os.path.splitext(shard_pdf_path)[0] + "_render_errors.json"
+        if os.path.exists(error_report_path):
+            with open(error_report_path, "r") as f:
+                failures.extend(json.load(f))
+    merger.write(output_pdf_path)
+    merger.close()
+
+    if failures:
+        error_report_path = os.path.splitext(output_pdf_path)[0] + "_render_errors.json"
+        with open(error_report_path, "w") as f:
+            json.dump(failures, f, indent=4)
+        print(f"{len(failures)} structures failed to render, see {error_report_path}")
+    pages = sum(manifest["pages"] for _, manifest in manifests)
+    print(f"Merged {len(manifests)} shards ({pages} pages, {manifests[0][1]['structures']} structures) into {output_pdf_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the shard PDFs of a run with --shard i/N into the final PDF.")
+    parser.add_argument("output_pdf", type=str, help="Path of the final PDF. The shards and their manifests are next to it.")
+    args = parser.parse_args()
+    merge_shards(args.output_pdf)
+
+
+if __name__ == "__main__":
+    main()
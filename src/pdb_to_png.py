@@ -1,6 +1,7 @@
 from pymol import cmd
 import os
 import time
+from structure_io import split_member_path, structure_name, structure_format, read_structure
 
 
 def configure_pymol_cmd(SETTINGS):
@@ -88,43 +89,220 @@ def color_by_plddt(SETTINGS):
 #
 
 
-def generate_image_from_pdb(pdb_path, output_path, SETTINGS):
-    # Load the file
-    cmd.delete("all")
-
-    cmd.load(pdb_path, quiet=1)
-    cmd.hide("all")
-
-    #### DEFAULT SCRIPT #########
-    default_pymol_script(SETTINGS)
-
-    ### COLOR BY PLDDT #####
-    # color_by_plddt(SETTINGS)
-
-    ####FAD/FMN BINDER SCRIPT ####
-    # cofactor_binder_pymol_script(SETTINGS)
+# Scripts selectable with the "pymol_script" setting. Register your custom script here.
+PYMOL_SCRIPTS = {
+    "default_pymol_script": default_pymol_script,
+    "color_by_plddt": color_by_plddt,
+    "cofactor_binder_pymol_script": cofactor_binder_pymol_script,
+    # "your_custom_pymol_script": your_custom_pymol_script,
+}
+
+
+def get_pymol_script(SETTINGS):
+    """Returns the pymol script function named by SETTINGS["pymol_script"]."""
+    script_name = SETTINGS.get("pymol_script", "default_pymol_script")
+    if script_name not in PYMOL_SCRIPTS:
+        raise ValueError(f"Unknown pymol_script '{script_name}'. Choose from: {', '.join(PYMOL_SCRIPTS)}")
+    return PYMOL_SCRIPTS[script_name]
+
+
+def level_of_detail_settings(SETTINGS, atom_count):
+    """
+    Returns the settings to render a structure with atom_count atoms.
+
+    Above level_of_detail.atom_threshold atoms, the pymol_settings overrides of the
+    level_of_detail config (e.g. a cheaper representation, no ray tracing) are applied,
+    which bounds the render time of very large structures.
+    """
+    lod = SETTINGS.get("level_of_detail")
+    if not lod or not lod["enabled"] or atom_count <= lod["atom_threshold"]:
+        return SETTINGS
+    return {**SETTINGS, "pymol_settings": {**SETTINGS["pymol_settings"], **lod["pymol_settings"]}}
+
+
+# Views selectable in the "views" setting: rotations (axis, degrees) of the camera after loading and styling.
+VIEW_PRESETS = {
+    "front": {"rotate": []},
+    "back": {"rotate": [["y", 180]]},
+    "side": {"rotate": [["y", 90]]},
+    "top": {"rotate": [["x", 90]]},
+    "bottom": {"rotate": [["x", -90]]},
+}
+
+
+def get_views(SETTINGS):
+    """
+    Returns the views to render every structure in, or an empty list for the single default view.
+
+    Entries of SETTINGS["views"] are preset names (see VIEW_PRESETS) or dicts with a "name", an
+    optional "orient" selection and optional "rotate" steps, e.g.
+    {"name": "site", "orient": "resn FAD", "rotate": [["y", 30]]}.
+    """
+    views = []
+    for view in SETTINGS.get("views") or []:
+        if isinstance(view, str):
+            if view not in VIEW_PRESETS:
+                raise ValueError(f"Unknown view '{view}'. Choose from: {', '.join(VIEW_PRESETS)}, or define one in the config")
+            view = {"name": view, **VIEW_PRESETS[view]}
+        views.append({"name": view["name"], "orient": view.get("orient"), "rotate": view.get("rotate", [])})
+    names = [view["name"] for view in views]
+    if len(set(names)) != len(names):
+        raise ValueError(f"View names must be unique, got {names}")
+    return views
+
+
+def apply_view(view, base_view):
+    """Turns the camera from base_view (the view after loading) to view."""
+    cmd.set_view(base_view)
+    if view["orient"]:
+        cmd.orient(view["orient"])
+    for axis, angle in view["rotate"]:
+        cmd.turn(axis, angle)
+    if view["rotate"] and not view["orient"]:
+        # Zoom again so the rotated structure fits the image.
+        cmd.zoom("all", complete=1)
+
+
+def add_timing(timings, step, start):
+    """Adds the seconds since start to timings[step] (if timings are collected) and returns the current time."""
+    now = time.perf_counter()
+    if timings is not None:
+        timings[step] = timings.get(step, 0.0) + now - start
+    return now
+
+
+def load_structure(path):
+    """
+    Loads a structure into pymol, named like the file.
+
+    Plain .pdb and .cif files are loaded by pymol directly. Compressed files and archive
+    members (see structure_io) are decompressed in memory and passed to pymol as a
+    string, so nothing is unpacked to disk.
+    """
+    if split_member_path(path)[1] is None and not path.lower().endswith(".gz"):
+        cmd.load(path, structure_name(path), quiet=1)
+    else:
+        cmd.load_raw(read_structure(path), structure_format(path), structure_name(path), quiet=1)
 
-    ####YOUR CUSTOM SCRIPT ########
-    # If SETTINGS parameters are not enough, write your own custom pymol script.
-    # your_custom_pymol_script(SETTINGS)
 
-    # New functionality to save PyMOL session
-    session_path = output_path.replace(
-        ".png", ".pse"
-    )  # Assuming output_path ends with .png
-    cmd.save(session_path)
-    while not os.path.exists(session_path):
-        time.sleep(0.02)
+def load_and_style_structure(pdb_path, SETTINGS, timings=None):
+    """Loads pdb_path as the only object and styles it with the chosen pymol script. Returns the settings it was styled with."""
+    start = time.perf_counter()
+    # Load the file. Workers are reused, so clear whatever the previous structure left behind.
+    cmd.delete("all")
 
-    # Save file and ensure it is written. Otherwise can write an empty file.
-    cmd.png(
-        output_path,
+    load_structure(pdb_path)
+    cmd.hide("all")
+    SETTINGS = level_of_detail_settings(SETTINGS, cmd.count_atoms("all"))
+    start = add_timing(timings, "load", start)
+
+    # Style the structure with the script chosen by SETTINGS["pymol_script"]
+    # (default_pymol_script, color_by_plddt, cofactor_binder_pymol_script, ...).
+    # If SETTINGS parameters are not enough, write your own custom pymol script
+    # and register it in PYMOL_SCRIPTS.
+    pymol_script = get_pymol_script(SETTINGS)
+    pymol_script(SETTINGS)
+    add_timing(timings, "style", start)
+    return SETTINGS
+
+
+def save_session(output_path, SETTINGS):
+    """Optionally saves the PyMOL session next to the image. cmd.save returns once the file is written."""
+    if SETTINGS["save_pse_session"] and output_path is not None:
+        session_path = os.path.splitext(output_path)[0] + ".pse"
+        cmd.save(session_path)
+
+
+def write_image_file(output_path, png_data):
+    """
+    Writes an image to a temporary file and renames it to output_path.
+
+    A render cache hit hard-links the cached image to output_path (see
+    render_cache.lookup_cached_image). Writing into that file would change the cache
+    entry too, the rename only replaces the link.
+    """
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(png_data)
+    os.replace(temp_path, output_path)
+
+
+def render_image(pdb_path, output_path, SETTINGS, timings=None):
+    """Renders the current scene and returns the PNG bytes, also writing them to output_path unless it is None."""
+    start = time.perf_counter()
+    png_data = render_png(SETTINGS)
+    if png_data is None:
+        # Older pymol versions cannot return the image, let pymol write it and wait for its command queue.
+        if output_path is None:
+            raise RuntimeError("This pymol version cannot return images from cmd.png, disable in_memory_images.")
+        # Like write_image_file: pymol writes a temporary file (ending in .png, or pymol appends it), which replaces output_path.
+        temp_path = f"{os.path.splitext(output_path)[0]}.{os.getpid()}.tmp.png"
+        cmd.png(
+            temp_path,
+            width=SETTINGS["image_dimensions"]["width"],
+            height=SETTINGS["image_dimensions"]["height"],
+            ray=SETTINGS["pymol_settings"]["ray_tracing"],
+            quiet=1,
+        )
+        cmd.sync()
+        if not os.path.exists(temp_path):
+            raise RuntimeError(f"pymol did not write an image for {pdb_path}")
+        with open(temp_path, "rb") as f:
+            png_data = f.read()
+        os.replace(temp_path, output_path)
+        add_timing(timings, "render", start)
+        return png_data
+
+    start = add_timing(timings, "render", start)
+    if output_path is not None:
+        # Writing the bytes ourselves confirms the image is complete once write() returns.
+        write_image_file(output_path, png_data)
+    add_timing(timings, "write", start)
+    return png_data
+
+
+def generate_image_from_pdb(pdb_path, output_path, SETTINGS, timings=None):
+    """
+    Renders pdb_path with pymol and returns the PNG bytes.
+
+    The image is also written to output_path, unless output_path is None (in-memory images).
+    If a timings dict is given, the seconds spent in the load, style, render and write
+    steps are stored in it.
+    """
+    return generate_view_images_from_pdb(pdb_path, [output_path], SETTINGS, [None], timings)[0]
+
+
+def generate_view_images_from_pdb(pdb_path, output_paths, SETTINGS, views, timings=None):
+    """
+    Loads and styles pdb_path once, then renders it in every view (see get_views) and returns the PNG bytes of each.
+
+    output_paths holds one path (or None) per view. A view of None renders the scene as loaded.
+    Timings are stored as in generate_image_from_pdb, summed over the views.
+    """
+    SETTINGS = load_and_style_structure(pdb_path, SETTINGS, timings)
+    base_view = cmd.get_view()
+
+    start = time.perf_counter()
+    save_session(output_paths[0], SETTINGS)
+    add_timing(timings, "write", start)
+
+    images = []
+    for view, output_path in zip(views, output_paths):
+        if view is not None:
+            apply_view(view, base_view)
+        images.append(render_image(pdb_path, output_path, SETTINGS, timings))
+    return images
+
+
+def render_png(SETTINGS):
+    """Renders the current scene and returns the PNG bytes, or None if this pymol version cannot return them."""
+    png_data = cmd.png(
+        None,
         width=SETTINGS["image_dimensions"]["width"],
         height=SETTINGS["image_dimensions"]["height"],
         ray=SETTINGS["pymol_settings"]["ray_tracing"],
         quiet=1,
     )
-    while not os.path.exists(output_path):
-        time.sleep(0.02)
-
-    cmd.delete("all")
+    if isinstance(png_data, bytes) and png_data:
+        return png_data
+    return None
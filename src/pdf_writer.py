@@ -0,0 +1,350 @@
+import os
+import io
+import zlib
+import hashlib
+from array import array
+from PIL import Image
+from fpdf import FPDF
+
+
+# Tile encodings: lossless Flate, JPEG (DCTDecode) and palette images (Indexed colour space).
+TILE_ENCODINGS = ("png", "jpeg", "palette")
+
+
+def source_size(source):
+    """Size in bytes of an image file or buffer, for the bytes saved report."""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    return len(source.getbuffer())
+
+
+def downsample_image(img, size):
+    """Shrinks img to fit in size (width, height), keeping its aspect ratio. Smaller images are left alone."""
+    scale = min(size[0] / img.width, size[1] / img.height) if size is not None else 1
+    if scale >= 1:
+        return img
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    if img.mode in ("RGBA", "LA"):
+        # Resample with premultiplied alpha, so transparent pixels do not bleed into the edges.
+        premultiplied = img.convert("RGBa" if img.mode == "RGBA" else "La")
+        return premultiplied.resize(size, Image.Resampling.LANCZOS).convert(img.mode)
+    return img.resize(size, Image.Resampling.LANCZOS)
+
+
+def flatten_image(img):
+    """Composites an image with transparency onto the white page, for encodings without an alpha channel."""
+    if img.mode not in ("RGBA", "LA"):
+        return img if img.mode in ("RGB", "L") else img.convert("RGB")
+    background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+    return Image.alpha_composite(background, img.convert("RGBA")).convert("RGB")
+
+
+def prepare_pdf_image(source, size=None, encoding="png", jpeg_quality=85, palette_colours=256):
+    """
+    Decodes an image into the streams a PDF image XObject needs.
+
+    Runs in worker processes so decoding and compression stay parallel while
+    the single writer process only serialises the result.
+
+    Args:
+    - source (str or file object): Path to, or buffer holding, the image.
+    - size (Tuple[int, int]): Optional pixel size to downsample the image to fit in (see tile_pixel_box).
+    - encoding (str): "png" keeps the pixels lossless with an alpha mask. "jpeg" and "palette"
+      flatten the image onto white and encode it as JPEG or with at most palette_colours colours.
+
+    Returns:
+    - dict: width, height, colour space, filter, compressed pixel data, optional compressed alpha
+      mask, a digest of the pixels, so the writer can embed identical images once, and the size
+      of the source image in bytes.
+    """
+    if encoding not in TILE_ENCODINGS:
+        raise ValueError(f"Unknown tile encoding '{encoding}'. Choose from: {', '.join(TILE_ENCODINGS)}")
+    with Image.open(source) as img:
+        img.load()
+        if img.mode == "P" and "transparency" in img.info:
+            img = img.convert("RGBA")
+        elif img.mode not in ("RGBA", "LA", "RGB", "L"):
+            img = img.convert("RGB")
+        img = downsample_image(img, size)
+
+        alpha = None
+        pdf_filter = "FlateDecode"
+        if encoding == "png":
+            if img.mode in ("RGBA", "LA"):
+                alpha = img.getchannel("A")
+                img = img.convert("RGB" if img.mode == "RGBA" else "L")
+            colorspace = "/DeviceRGB" if img.mode == "RGB" else "/DeviceGray"
+            data = zlib.compress(img.tobytes())
+        elif encoding == "jpeg":
+            img = flatten_image(img)
+            colorspace = "/DeviceRGB" if img.mode == "RGB" else "/DeviceGray"
+            buffer = io.BytesIO()
+            img.save(buffer, "JPEG", quality=jpeg_quality)
+            data = buffer.getvalue()
+            pdf_filter = "DCTDecode"
+        else:
+            img = flatten_image(img).convert("RGB").quantize(colors=palette_colours)
+            palette = bytes(img.getpalette()[:3 * (img.getextrema()[1] + 1)])
+            colorspace = f"[/Indexed /DeviceRGB {len(palette) // 3 - 1} <{palette.hex()}>]"
+            data = zlib.compress(img.tobytes())
+
+        smask = zlib.compress(alpha.tobytes()) if alpha is not None else None
+        digest = hashlib.blake2b(data, digest_size=16)
+        digest.update(smask or b"")
+        digest.update(f"{img.width}x{img.height}{colorspace}".encode())
+        return {
+            "width": img.width,
+            "height": img.height,
+            "colorspace": colorspace,
+            "filter": pdf_filter,
+            "data": data,
+            "smask": smask,
+            "digest": digest.digest(),
+            "source_bytes": source_size(source),
+        }
+
+
+def escape_pdf_text(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+class StreamingPdfWriter:
+    """
+    Writes a PDF one page at a time straight to disk.
+
+    Unlike FPDF, which keeps the whole document in memory until output(), every
+    finished page is flushed to the file immediately, so memory stays flat and the
+    PDF grows while rendering continues. Only the cross-reference offsets, page
+    ids and image digests are kept until close() writes the page tree and trailer.
+
+    Every distinct image is embedded once as an XObject and shared by all
+    pages that show it.
+
+    checkpoint() returns the state added since the previous checkpoint. Passing
+    all checkpoints of a document back as checkpoints= reopens it at the last one,
+    so an interrupted document can be continued and comes out byte-identical.
+
+    Coordinates are given in the document unit (mm by default) with the origin in
+    the top-left corner, like FPDF.
+    """
+
+    PAGES_ID = 1
+    FONT_ID = 2
+
+    def __init__(self, path, orientation="L", unit="mm", format="A4", checkpoints=None):
+        # FPDF is only used for its page formats and Helvetica font metrics.
+        self.metrics = FPDF(orientation=orientation, unit=unit, format=format)
+        self.w, self.h, self.k = self.metrics.w, self.metrics.h, self.metrics.k
+        self.c_margin = self.metrics.c_margin
+
+        self.offsets = array("Q", [0])  # index = object id, object 0 is unused
+        self.page_ids = array("Q")
+        self.page_content = None
+        self.page_images = None
+        self.image_ids = {}  # image digest -> XObject id
+        self.font_size = 12
+        # Sizes of the distinct images written by this writer, for the bytes saved report
+        self.source_image_bytes = 0
+        self.embedded_image_bytes = 0
+
+        # State added since the last checkpoint
+        self.checkpointed_objects = 1
+        self.checkpointed_pages = 0
+        self.new_images = []
+
+        if checkpoints:
+            for checkpoint in checkpoints:
+                self.restore_checkpoint(checkpoint)
+            self.checkpointed_objects = len(self.offsets)
+            self.checkpointed_pages = len(self.page_ids)
+            self.file = open(path, "r+b")
+            self.file.truncate(checkpoints[-1]["end_offset"])
+            self.file.seek(checkpoints[-1]["end_offset"])
+        else:
+            self.offsets.extend([0, 0])  # reserved for PAGES_ID and FONT_ID
+            self.file = open(path, "wb")
+            self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+            self.write_object(self.FONT_ID, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def abort(self):
+        """Closes the file without finishing the document, e.g. after an error."""
+        self.file.close()
+
+    @property
+    def page_count(self):
+        return len(self.page_ids)
+
+    def checkpoint(self):
+        """Returns the state added since the previous checkpoint. Call between pages."""
+        self.file.flush()
+        # The pages must be on disk before a journal refers to them.
+        os.fsync(self.file.fileno())
+        checkpoint = {
+            "end_offset": self.file.tell(),
+            "offsets": list(self.offsets[self.checkpointed_objects:]),
+            "page_ids": list(self.page_ids[self.checkpointed_pages:]),
+            "image_ids": self.new_images,
+        }
+        self.checkpointed_objects = len(self.offsets)
+        self.checkpointed_pages = len(self.page_ids)
+        self.new_images = []
+        return checkpoint
+
+    def restore_checkpoint(self, checkpoint):
+        self.offsets.extend(checkpoint["offsets"])
+        self.page_ids.extend(checkpoint["page_ids"])
+        for digest, image_id in checkpoint["image_ids"]:
+            self.image_ids[bytes.fromhex(digest)] = image_id
+
+    def new_object_id(self):
+        self.offsets.append(0)
+        return len(self.offsets) - 1
+
+    def write_object(self, object_id, body, stream=None):
+        self.offsets[object_id] = self.file.tell()
+        self.file.write(f"{object_id} 0 obj\n".encode())
+        self.file.write(body)
+        if stream is not None:
+            self.file.write(b"\nstream\n")
+            self.file.write(stream)
+            self.file.write(b"\nendstream")
+        self.file.write(b"\nendobj\n")
+
+    def write_image(self, image):
+        """Writes a prepared image as an XObject, unless an identical one was written before, and returns its object id."""
+        if image["digest"] in self.image_ids:
+            return self.image_ids[image["digest"]]
+        smask = ""
+        if image["smask"] is not None:
+            smask_id = self.new_object_id()
+            self.write_object(
+                smask_id,
+                (f"<< /Type /XObject /Subtype /Image /Width {image['width']} /Height {image['height']} "
+                 f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(image['smask'])} >>").encode(),
+                image["smask"],
+            )
+            smask = f" /SMask {smask_id} 0 R"
+        image_id = self.new_object_id()
+        self.write_object(
+            image_id,
+            (f"<< /Type /XObject /Subtype /Image /Width {image['width']} /Height {image['height']} "
+             f"/ColorSpace {image['colorspace']} /BitsPerComponent 8 /Filter /{image['filter']}{smask} "
+             f"/Length {len(image['data'])} >>").encode(),
+            image["data"],
+        )
+        self.image_ids[image["digest"]] = image_id
+        self.new_images.append([image["digest"].hex(), image_id])
+        self.source_image_bytes += image["source_bytes"]
+        self.embedded_image_bytes += len(image["data"]) + len(image["smask"] or b"")
+        return image_id
+
+    def add_page(self):
+        if self.page_content is not None:
+            self.end_page()
+        self.page_content = []
+        self.page_images = {}
+
+    def set_font_size(self, size):
+        self.font_size = size
+        self.metrics.set_font("Helvetica", size=size)
+
+    def get_string_width(self, text):
+        return self.metrics.get_string_width(text)
+
+    def image(self, image, x, y, w, h):
+        """Draws a prepared image (see prepare_pdf_image) at x, y with size w x h."""
+        image_id = self.write_image(image)
+        if image_id not in self.page_images:
+            self.page_images[image_id] = f"I{len(self.page_images) + 1}"
+        name = self.page_images[image_id]
+        k = self.k
+        self.page_content.append(f"q {w * k:.2f} 0 0 {h * k:.2f} {x * k:.2f} {(self.h - (y + h)) * k:.2f} cm /{name} Do Q")
+
+    def split_lines(self, text, w):
+        """Breaks text into lines fitting in a cell of width w, the same way FPDF.multi_cell does."""
+        wmax = w - 2 * self.c_margin
+        lines = []
+        start = 0
+        separator = -1
+        width = 0
+        i = 0
+        while i < len(text):
+            char = text[i]
+            if char == " ":
+                separator = i
+            width += self.get_string_width(char)
+            if width > wmax:
+                if separator == -1:
+                    if i == start:
+                        i += 1
+                    lines.append(text[start:i])
+                else:
+                    lines.append(text[start:separator])
+                    i = separator + 1
+                separator = -1
+                start = i
+                width = 0
+            else:
+                i += 1
+        lines.append(text[start:i])
+        return lines
+
+    def text_box(self, text, x, y, w, line_height, fill_colour=(255, 255, 255)):
+        """Writes centred, wrapped text over a filled background, like FPDF.multi_cell(..., align='C', fill=True)."""
+        k = self.k
+        r, g, b = (channel / 255 for channel in fill_colour)
+        for line in self.split_lines(text, w):
+            self.page_content.append(
+                f"{r:.3f} {g:.3f} {b:.3f} rg {x * k:.2f} {(self.h - y) * k:.2f} {w * k:.2f} {-line_height * k:.2f} re f 0 g"
+            )
+            if line:
+                dx = (w - self.get_string_width(line)) / 2.0
+                baseline = self.h - (y + 0.5 * line_height + 0.3 * self.font_size / k)
+                encoded = escape_pdf_text(line.encode("latin-1", "replace").decode("latin-1"))
+                self.page_content.append(
+                    f"BT /F1 {self.font_size:.2f} Tf {(x + dx) * k:.2f} {baseline * k:.2f} Td ({encoded}) Tj ET"
+                )
+            y += line_height
+
+    def end_page(self):
+        """Flushes the current page to disk."""
+        content = zlib.compress("\n".join(self.page_content).encode("latin-1"))
+        content_id = self.new_object_id()
+        self.write_object(content_id, f"<< /Filter /FlateDecode /Length {len(content)} >>".encode(), content)
+
+        xobjects = " ".join(f"/{name} {image_id} 0 R" for image_id, name in self.page_images.items())
+        page_id = self.new_object_id()
+        self.write_object(
+            page_id,
+            (f"<< /Type /Page /Parent {self.PAGES_ID} 0 R /MediaBox [0 0 {self.w * self.k:.2f} {self.h * self.k:.2f}] "
+             f"/Resources << /ProcSet [/PDF /Text /ImageB /ImageC] /Font << /F1 {self.FONT_ID} 0 R >> /XObject << {xobjects} >> >> "
+             f"/Contents {content_id} 0 R >>").encode(),
+        )
+        self.page_ids.append(page_id)
+        self.page_content = None
+        self.page_images = None
+        self.file.flush()
+
+    def close(self):
+        """Writes the page tree, catalog and cross-reference table."""
+        if self.page_content is not None:
+            self.end_page()
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self.write_object(self.PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode())
+        catalog_id = self.new_object_id()
+        self.write_object(catalog_id, f"<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>".encode())
+
+        xref_offset = self.file.tell()
+        self.file.write(f"xref\n0 {len(self.offsets)}\n0000000000 65535 f \n".encode())
+        self.file.write("".join(f"{offset:010d} 00000 n \n" for offset in self.offsets[1:]).encode())
+        self.file.write(f"trailer\n<< /Size {len(self.offsets)} /Root {catalog_id} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+        self.file.close()
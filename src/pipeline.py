@@ -0,0 +1,169 @@
+import os
+import json
+import itertools
+from collections import deque
+from helpers import (
+    iter_chunks,
+    generate_pdf_for_pages,
+    prepare_page_images,
+    write_pdf_page,
+    merge_temp_pdfs,
+    result_tiles,
+    structures_per_page,
+    tile_cells,
+    tile_pixel_box,
+    tile_file_path,
+)
+from pdf_writer import StreamingPdfWriter, TILE_ENCODINGS
+from run_metrics import NullMetrics, timed_call
+from worker_pool import create_render_pool, get_pool_context, imap_render
+
+
+def run_render_pipeline(selected_files, temp_directory, output_pdf_path, SETTINGS, license_file_path=None,
+                        journal=None, resume_state=None, metrics=None):
+    """
+    Renders selected_files and streams the resulting pages into output_pdf_path.
+
+    Images come back in order from the pool of pre-initialised pymol workers. As soon as a page's worth
+    of images is ready it is sent to the layout pool (in-memory images arrive already decoded and skip it), and finished pages are appended
+    to the output in order while rendering continues. Only the pages in flight are
+    held in memory.
+
+    With a journal, rendered images and finished pages are recorded as they complete.
+    With the resume_state of an interrupted run (RunJournal.load), finished pages are
+    kept, images already on disk are not rendered again, and the PDF continues exactly
+    where it stopped.
+
+    metrics (see run_metrics) receives the per-structure timings and the time spent
+    rendering, laying out pages (in the layout pool), writing and merging the PDF.
+
+    With several views per structure, each structure fills one tile per view, and
+    the views of a structure sit next to each other on a row (see tile_cells).
+
+    Structures that failed to render (see SupervisedRenderPool) are listed in
+    <output>_render_errors.json next to the PDF.
+
+    Returns:
+    - Tuple[int, int, List[dict]]: Number of rendered images, how many of them were render
+      cache hits, and the pdb_file and error of every structure that failed to render.
+    """
+    metrics = metrics or NullMetrics()
+    images_per_page = structures_per_page(SETTINGS)
+    engine = SETTINGS["pdf_settings"]["engine"]
+    layout_processes = SETTINGS["pdf_settings"]["layout_processes"]
+    # Bound the number of laid out pages waiting to be written so memory stays flat.
+    max_pending_pages = 2 * layout_processes
+
+    finished_pages = resume_state["pages"] if resume_state is not None else []
+    rendered_by_index = resume_state["rendered"] if resume_state is not None else {}
+    page_index = len(finished_pages)
+    first_index = page_index * images_per_page
+
+    pending_pages = deque()
+    temp_pdf_paths = [page["temp_pdf_path"] for page in finished_pages if "temp_pdf_path" in page]
+    rendered = 0
+    cache_hits = 0
+    failures = []
+
+    writer = None
+    if engine == "stream":
+        writer = StreamingPdfWriter(output_pdf_path,
+                                    orientation=SETTINGS["pdf_settings"]["orientation"],
+                                    unit=SETTINGS["pdf_settings"]["unit"],
+                                    format=SETTINGS["pdf_settings"]["format"],
+                                    checkpoints=[page["checkpoint"] for page in finished_pages])
+    elif engine != "fpdf":
+        raise ValueError(f"Unknown pdf engine '{engine}'. Use 'stream' or 'fpdf'.")
+    elif SETTINGS["in_memory_images"]["enabled"]:
+        raise ValueError("in_memory_images requires the 'stream' pdf engine.")
+    if SETTINGS["tile_quality"]["format"] not in TILE_ENCODINGS:
+        raise ValueError(f"Unknown tile_quality format '{SETTINGS['tile_quality']['format']}'. Choose from: {', '.join(TILE_ENCODINGS)}")
+    # Sizes of the rendered images and of the tiles made from them for the PDF (fpdf engine)
+    tile_bytes = {"source": 0, "embedded": 0}
+
+    def write_next_page():
+        nonlocal page_index
+        page, labels, cells, task = pending_pages.popleft()
+        if task is not None:
+            with metrics.stage("layout_wait"):
+                layout_seconds, layout_result = task.get()
+            metrics.add_time("layout", layout_seconds)
+        if writer is None:
+            temp_pdf_paths.append(layout_result)
+            for _, image_path, _ in page:
+                tile_bytes["source"] += os.path.getsize(image_path)
+                tile_bytes["embedded"] += os.path.getsize(tile_file_path(image_path, SETTINGS))
+            if journal is not None:
+                journal.record_page(page_index, temp_pdf_path=temp_pdf_paths[-1])
+        else:
+            prepared_images = layout_result if task is not None else [image for _, _, image in page]
+            with metrics.stage("pdf_write"):
+                write_pdf_page(writer, None, prepared_images, SETTINGS, labels=labels, cells=cells)
+                if journal is not None:
+                    journal.record_page(page_index, checkpoint=writer.checkpoint())
+        page_index += 1
+
+    # Files on finished pages are skipped, files rendered before the interruption are picked up from disk.
+    jobs = ((pdb_file, rendered_by_index.get(index))
+            for index, pdb_file in itertools.islice(enumerate(selected_files), first_index, None))
+
+    try:
+        with metrics.stage("render"), \
+                create_render_pool(SETTINGS, temp_directory, license_file_path) as render_pool, \
+                get_pool_context(SETTINGS).Pool(layout_processes) as layout_pool:
+            rendered_images = imap_render(render_pool, jobs, SETTINGS["worker_pool"]["batch_size"])
+            for page in iter_chunks(rendered_images, images_per_page):
+                tiles = [tile for result in page for tile in result_tiles(result, SETTINGS)]
+                labels = [label for label, _, _ in tiles]
+                image_paths = [image_path for _, image_path, _ in tiles]
+                cells = tile_cells(len(page), SETTINGS)
+                start = first_index + rendered
+                rendered += len(page)
+                cache_hits += sum(1 for result in page if result["cache_hit"])
+                failures.extend({"pdb_file": result["pdb_file"], "error": result["error"]} for result in page if result["error"])
+                for result in page:
+                    metrics.record_structure(result)
+                if journal is not None:
+                    for index, result in enumerate(page, start):
+                        # Failed structures are not recorded, so a resumed run tries them again.
+                        if result["image_path"] is not None and not result["resumed"] and not result["error"]:
+                            journal.record_render(index, result["image_path"])
+
+                if writer is None:
+                    task = layout_pool.apply_async(timed_call, (generate_pdf_for_pages, start, start + len(page), image_paths, temp_directory, SETTINGS, cells, labels))
+                elif tiles[0][2] is None:
+                    task = layout_pool.apply_async(timed_call, (prepare_page_images, image_paths, SETTINGS))
+                else:
+                    task = None
+                pending_pages.append((tiles, labels, cells, task))
+
+                while pending_pages and (pending_pages[0][3] is None or pending_pages[0][3].ready() or len(pending_pages) > max_pending_pages):
+                    write_next_page()
+            while pending_pages:
+                write_next_page()
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+
+    if writer is not None:
+        tile_bytes = {"source": writer.source_image_bytes, "embedded": writer.embedded_image_bytes}
+    if (tile_pixel_box(SETTINGS) is not None or SETTINGS["tile_quality"]["format"] != "png") and tile_bytes["source"]:
+        saved = tile_bytes["source"] - tile_bytes["embedded"]
+        print(f"Tiles: {tile_bytes['source'] / 1e6:.1f} MB of rendered images embedded as {tile_bytes['embedded'] / 1e6:.1f} MB "
+              f"({saved / 1e6:.1f} MB, {100 * saved / tile_bytes['source']:.0f}% saved)")
+
+    with metrics.stage("merge"):
+        if writer is not None:
+            writer.close()
+            print(f"Final PDF saved to {output_pdf_path}")
+        else:
+            merge_temp_pdfs(temp_pdf_paths, output_pdf_path)
+    if failures:
+        error_report_path = os.path.splitext(output_pdf_path)[0] + "_render_errors.json"
+        with open(error_report_path, "w") as f:
+            json.dump(failures, f, indent=4)
+        print(f"{len(failures)} structures failed to render and are shown as placeholders, see {error_report_path}")
+    if journal is not None:
+        journal.finish()
+    return rendered, cache_hits, failures
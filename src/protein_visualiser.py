@@ -1,32 +1,25 @@
 import os
-import random
-from multiprocessing import Pool
+import math
+import itertools
 import shutil
 import time
-from helpers import (
-    process_pdb_file,
-    generate_pdf_for_pages,
-    split_images_for_pages,
-    merge_temp_pdfs,
-    list_all_pdb_files,
-    wait_until_all_files_are_present,
-    create_arg_parser,
-    load_settings,
-    check_license_in_directory,
-    get_pdb_paths_from_file,
-    create_unique_temp_directory,
-)
-from pdb_to_png import configure_pymol_cmd
+from cli import create_arg_parser, load_settings, find_license_file
+from run_journal import RunJournal, run_fingerprint
+from run_metrics import create_metrics
+from sharding import parse_shard, shard_page_range, shard_paths, selection_digest, write_shard_manifest, load_shard_manifest
 
 
 
 def main():
-    # activate pymol license
-    license_info = check_license_in_directory()
-    print(license_info)
-
     parser = create_arg_parser()
     args = parser.parse_args()
+
+    # pymol, PIL and fpdf are only imported once the arguments are parsed, so --help and argument errors return at once
+    from helpers import activate_license, iter_pdb_paths_from_file, reservoir_sample, structures_per_page
+    from pipeline import run_render_pipeline
+    from discovery import iter_structure_files
+    from render_cache import get_render_cache_directory, evict_least_recently_used
+    from watch import watch_input_folder
     
     # If the script is run without specifying a config, use the default settings
     if args.config is None:
@@ -38,8 +31,6 @@ def main():
     # Load settings from the default or provided JSON config
     SETTINGS = load_settings(args.config)
 
-    configure_pymol_cmd(SETTINGS)
-
     # Adjust default SETTINGS only if parameters were passed
     if args.grid:
         print(f'changing grid {SETTINGS["grid"]["columns"], SETTINGS["grid"]["rows"]} to {args.grid}')
@@ -47,6 +38,9 @@ def main():
     if args.num_files is not None:
         print(f'changing num_files {SETTINGS["num_files"]} to {args.num_files}')
         SETTINGS["num_files"] = args.num_files
+    if args.seed is not None:
+        print(f'changing seed {SETTINGS["seed"]} to {args.seed}')
+        SETTINGS["seed"] = args.seed
     if args.write_filenames is not None:
         print(f'changing  write_filenames{SETTINGS["write_filenames"]} to {args.write_filenames}')
         SETTINGS["write_filenames"] = args.write_filenames
@@ -59,30 +53,76 @@ def main():
     if args.filename_pattern is not None:
         print(f'changing filename_pattern {SETTINGS["filename_pattern"]} to {args.filename_pattern}')
         SETTINGS["filename_pattern"] = args.filename_pattern
+    if args.discovery_index is not None:
+        print(f'changing discovery_index {SETTINGS["discovery_index"]} to {args.discovery_index}')
+        SETTINGS["discovery_index"] = args.discovery_index
     if args.sort_pdbs_in_pdf is not None:
         print(f'changing sort_pdbs_in_pdf {SETTINGS["sort_pdbs_in_pdf"]} to {args.sort_pdbs_in_pdf}')
         SETTINGS["sort_pdbs_in_pdf"] = args.sort_pdbs_in_pdf
+    if args.processes is not None:
+        print(f'changing worker_pool processes {SETTINGS["worker_pool"]["processes"]} to {args.processes}')
+        SETTINGS["worker_pool"]["processes"] = args.processes
+    if args.batch_size is not None:
+        print(f'changing worker_pool batch_size {SETTINGS["worker_pool"]["batch_size"]} to {args.batch_size}')
+        SETTINGS["worker_pool"]["batch_size"] = args.batch_size
+    if args.in_memory is not None:
+        print(f'changing in_memory_images enabled {SETTINGS["in_memory_images"]["enabled"]} to {args.in_memory}')
+        SETTINGS["in_memory_images"]["enabled"] = args.in_memory
+    if args.keep_png is not None:
+        print(f'changing in_memory_images keep_png {SETTINGS["in_memory_images"]["keep_png"]} to {args.keep_png}')
+        SETTINGS["in_memory_images"]["keep_png"] = args.keep_png
+    if args.task_timeout is not None:
+        print(f'changing worker_pool task_timeout_seconds {SETTINGS["worker_pool"]["task_timeout_seconds"]} to {args.task_timeout}')
+        SETTINGS["worker_pool"]["task_timeout_seconds"] = args.task_timeout
+    if args.max_retries is not None:
+        print(f'changing worker_pool max_retries {SETTINGS["worker_pool"]["max_retries"]} to {args.max_retries}')
+        SETTINGS["worker_pool"]["max_retries"] = args.max_retries
+    if args.lod_atom_threshold is not None:
+        print(f'changing level_of_detail atom_threshold {SETTINGS["level_of_detail"]["atom_threshold"]} to {args.lod_atom_threshold} and enabling it')
+        SETTINGS["level_of_detail"]["enabled"] = True
+        SETTINGS["level_of_detail"]["atom_threshold"] = args.lod_atom_threshold
+    if args.debounce is not None:
+        print(f'changing watch debounce_seconds {SETTINGS["watch"]["debounce_seconds"]} to {args.debounce}')
+        SETTINGS["watch"]["debounce_seconds"] = args.debounce
+    if args.tile_dpi is not None:
+        print(f'changing tile_quality dpi {SETTINGS["tile_quality"]["dpi"]} to {args.tile_dpi}')
+        SETTINGS["tile_quality"]["dpi"] = args.tile_dpi
+    if args.tile_format is not None:
+        print(f'changing tile_quality format {SETTINGS["tile_quality"]["format"]} to {args.tile_format}')
+        SETTINGS["tile_quality"]["format"] = args.tile_format
+    if args.views is not None:
+        print(f'changing views {SETTINGS["views"]} to {args.views}')
+        SETTINGS["views"] = args.views
+    if args.no_metrics is not None:
+        print(f'changing metrics enabled {SETTINGS["metrics"]["enabled"]} to {not args.no_metrics}')
+        SETTINGS["metrics"]["enabled"] = not args.no_metrics
+    if args.no_render_cache is not None:
+        print(f'changing render_cache enabled {SETTINGS["render_cache"]["enabled"]} to {not args.no_render_cache}')
+        SETTINGS["render_cache"]["enabled"] = not args.no_render_cache
+    SETTINGS["render_cache"]["directory"] = get_render_cache_directory(SETTINGS)
+
+    # activate pymol license
+    license_file_path = find_license_file(SETTINGS["pymol_license_file"])
+    license_info = activate_license(license_file_path)
+    print(license_info)
+    metrics = create_metrics(SETTINGS)
 
     # Check if the input was provided as a folder
     if args.input_folder:
         print(f"Processing PDB files in folder: {args.input_folder}")
-        # Handle the folder input
-        all_files = list_all_pdb_files(args.input_folder, SETTINGS["filename_pattern"])
+        # Handle the folder input. Files are discovered lazily and filtered while walking.
+        candidate_files = iter_structure_files(args.input_folder, SETTINGS["filename_pattern"], index_path=SETTINGS["discovery_index"])
         path_name = os.path.basename(args.input_folder).replace('/', '_').strip('_')
 
     # Check if the input was provided as a text file
     elif args.input_txt:
         print(f"Processing PDB files listed in: {args.input_txt}")
-        all_files = get_pdb_paths_from_file(args.input_txt)
+        candidate_files = (f for f in iter_pdb_paths_from_file(args.input_txt) if SETTINGS["filename_pattern"] in os.path.basename(f))
         path_name = os.path.basename(args.input_txt).replace('/', '_').replace('.txt', '').strip('_')
+    # Discovery is lazy, so its time is what the consumers spend waiting for the next file
+    candidate_files = metrics.timed_iter("discovery", candidate_files)
 
 
-    # Create a unique temporary directory
-    # temp_directory = create_unique_temp_directory(SETTINGS["output_directory"], path_name, SETTINGS["filename_pattern"])
-    temp_directory = os.path.join(SETTINGS["output_directory"], f"{SETTINGS['output_filename']}_source_files")
-    if not os.path.exists(temp_directory):
-        os.makedirs(temp_directory)
-
     # Define the name and path to the output PDF
     if SETTINGS["output_filename"] is not None:
         output_pdf_path = os.path.join(SETTINGS["output_directory"], f"{SETTINGS['output_filename'].replace('.pdf','')}.pdf")
@@ -91,40 +131,157 @@ def main():
             output_pdf_path = os.path.join(SETTINGS["output_directory"], f"{path_name}_all.pdf")
         else:
             output_pdf_path = os.path.join(SETTINGS["output_directory"], f"{path_name}_containing_{SETTINGS['filename_pattern']}.pdf")
-            
-    print(f"Found {len(all_files)} .pdb files containing '{SETTINGS['filename_pattern']}'")
-    matching_files = [f for f in all_files if SETTINGS["filename_pattern"] in os.path.basename(f)]
-    if len(matching_files)<1:
-        raise ValueError(f"No PDB files found matching pattern: '{SETTINGS['filename_pattern']}' in '{args.input_folder or args.input_txt}'")
-
-    # Select files at random
-    selected_files = random.sample(matching_files, min(SETTINGS["num_files"], len(matching_files)))
-    print(f"Selected {len(selected_files)} files at random")
-
-    if SETTINGS["sort_pdbs_in_pdf"]:
-        selected_files = sorted(selected_files)
-    
-    # Create and save the images with multiprocessing
-    print(f"Generating {len(selected_files)} images with pymol")
-    with Pool() as pool:
-        image_paths = pool.starmap(process_pdb_file, [(pdb_file, temp_directory, SETTINGS) for pdb_file in selected_files])
-
-    # Check if all images are present
-    wait_until_all_files_are_present(image_paths)
-
-    # Create and save the PDF pages 
-    print("Creating PDF pages...")
-    image_splits = split_images_for_pages(image_paths, (SETTINGS["grid"]["columns"], SETTINGS["grid"]["rows"]))
-    with Pool() as pool:
-        temp_pdf_paths = pool.starmap(generate_pdf_for_pages, [(start, end, image_subset, temp_directory, SETTINGS) for start, end, image_subset in image_splits])
-    
-    # Assemble PDF pages to a multi-page PDF
-    print("Assembling PDF...")
-    merge_temp_pdfs(temp_pdf_paths, output_pdf_path)
 
-    # Remove temporaty directory with all images and pdf pages.
-    if not SETTINGS["keep_png_pse_files"]:
+    num_files = SETTINGS["num_files"] if SETTINGS["num_files"] and SETTINGS["num_files"] > 0 else None
+    # With several views per structure a page holds fewer structures than grid cells
+    page_structures = structures_per_page(SETTINGS)
+
+    # Create a unique temporary directory
+    # temp_directory = create_unique_temp_directory(SETTINGS["output_directory"], path_name, SETTINGS["filename_pattern"])
+    temp_directory = os.path.join(SETTINGS["output_directory"], f"{SETTINGS['output_filename']}_source_files")
+
+    # With --shard this run renders only its share of the pages into a shard PDF, merged later by merge_shards.py
+    shard = None
+    if args.shard is not None:
+        shard = parse_shard(args.shard)
+        if num_files is not None and SETTINGS["seed"] is None:
+            raise ValueError("--shard needs --seed (or --num_files 0), so that every shard selects the same files")
+        final_pdf_path = output_pdf_path
+        output_pdf_path, manifest_path = shard_paths(final_pdf_path, *shard)
+        temp_directory = os.path.join(SETTINGS["output_directory"], f"{SETTINGS['output_filename']}_shard_{shard[0]}_of_{shard[1]}_source_files")
+
+    # Watch mode keeps extending the PDF of this run, so it needs every file in discovery order and the journal
+    if args.watch:
+        if not args.input_folder:
+            raise ValueError("--watch needs --input_folder")
+        if num_files is not None or SETTINGS["sort_pdbs_in_pdf"]:
+            raise ValueError("--watch adds every new file to the PDF, pass --num_files 0 and do not sort")
+        if shard is not None or not SETTINGS["run_journal"]:
+            raise ValueError("--watch cannot be combined with --shard and needs run_journal")
+        if SETTINGS["pdf_settings"]["engine"] != "stream":
+            raise ValueError("--watch needs the 'stream' pdf engine, the 'fpdf' engine merges every page again on each update")
+
+    # In-memory images only write to the temporary directory if the PNGs are kept or the run is journaled.
+    in_memory = SETTINGS["in_memory_images"]["enabled"]
+    os.makedirs(SETTINGS["output_directory"], exist_ok=True)
+    if (not in_memory or SETTINGS["in_memory_images"]["keep_png"] or SETTINGS["run_journal"]) and not os.path.exists(temp_directory):
+        os.makedirs(temp_directory)
+
+    # Journal the run so it can be resumed after an interruption
+    journal = RunJournal(temp_directory) if SETTINGS["run_journal"] else None
+    fingerprint = run_fingerprint(SETTINGS, args.input_folder or args.input_txt, output_pdf_path)
+    resume_state = None
+    if args.resume:
+        if journal is None or not journal.exists():
+            raise FileNotFoundError(f"Nothing to resume: no run journal in '{temp_directory}'")
+        resume_state = journal.load()
+        if resume_state["fingerprint"] != fingerprint:
+            raise ValueError("Cannot resume: the input, output or settings differ from the interrupted run")
+        if resume_state["finished"]:
+            print(f"The run already finished, see {output_pdf_path}")
+            if args.watch:
+                watch_input_folder(args.input_folder, temp_directory, output_pdf_path, SETTINGS, license_file_path, journal)
+            return
+        print(f"Resuming after {len(resume_state['pages'])} finished pages")
+        journal.reopen()
+    elif journal is not None:
+        if journal.exists() and not journal.load()["finished"]:
+            print(f"An interrupted run was found in '{temp_directory}', starting over. Pass --resume to continue it instead.")
+        journal.start(fingerprint)
+
+    no_files_error = ValueError(f"No PDB files found matching pattern: '{SETTINGS['filename_pattern']}' in '{args.input_folder or args.input_txt}'")
+    if resume_state is not None and resume_state["selection_complete"]:
+        # The interrupted run recorded its whole selection, so nothing needs to be discovered again
+        selected_files = resume_state["selection"]
+        print(f"Selected the {len(selected_files)} files of the interrupted run")
+    elif num_files is not None or SETTINGS["sort_pdbs_in_pdf"]:
+        # Select files at random with a reservoir over the discovered files, holding only the selection in memory
+        selected_files, found = reservoir_sample(candidate_files, num_files, SETTINGS["seed"])
+        print(f"Found {found} .pdb files containing '{SETTINGS['filename_pattern']}'")
+        if found < 1:
+            raise no_files_error
+        print(f"Selected {len(selected_files)} files at random")
+
+        if SETTINGS["sort_pdbs_in_pdf"]:
+            selected_files = sorted(selected_files)
+    else:
+        # Every matching file is selected, so rendering can start while discovery continues
+        first_file = next(candidate_files, None)
+        if first_file is None:
+            raise no_files_error
+        selected_files = itertools.chain([first_file], candidate_files)
+        print(f"Selected all files containing '{SETTINGS['filename_pattern']}', rendering while they are discovered")
+
+    if shard is not None:
+        if resume_state is not None and resume_state["selection_complete"]:
+            # The journal holds this shard's files, the manifest its place in the whole run
+            manifest = load_shard_manifest(manifest_path)
+        else:
+            # Every shard selects the same files, then keeps its contiguous range of pages
+            selected_files = list(selected_files)
+            first_page, last_page = shard_page_range(len(selected_files), page_structures, *shard)
+            manifest = {
+                "shard": shard[0],
+                "shards": shard[1],
+                "first_page": first_page,
+                "pages": last_page - first_page,
+                "structures_per_page": page_structures,
+                "structures": len(selected_files),
+                "selection_digest": selection_digest(selected_files),
+                "settings": fingerprint["settings"],
+                "pdf": os.path.basename(output_pdf_path),
+                "complete": False,
+            }
+            write_shard_manifest(manifest_path, manifest)
+            selected_files = selected_files[first_page * page_structures:last_page * page_structures]
+        total_pages = math.ceil(manifest["structures"] / page_structures)
+        print(f"Shard {shard[0]}/{shard[1]}: pages {manifest['first_page'] + 1} to {manifest['first_page'] + manifest['pages']} of {total_pages}")
+        if not manifest["pages"]:
+            print("This shard has no pages to render")
+            manifest["complete"] = True
+            write_shard_manifest(manifest_path, manifest)
+            if journal is not None:
+                journal.finish()
+            return
+
+    if journal is not None:
+        recorded = 0
+        if resume_state is not None:
+            if not resume_state["selection_complete"]:
+                selected_files = journal.continue_selection(selected_files, resume_state["selection"])
+            recorded = len(resume_state["selection"])
+        selected_files = journal.record_selection(selected_files, already_recorded=recorded)
+        if num_files is not None or SETTINGS["sort_pdbs_in_pdf"]:
+            # Record a random selection right away, it cannot be drawn again without a seed
+            selected_files = list(selected_files)
+
+    # Render the images and stream them into PDF pages as they are ready
+    print("Generating images with pymol and assembling PDF...")
+    rendered, cache_hits, failures = run_render_pipeline(selected_files, temp_directory, output_pdf_path, SETTINGS, license_file_path,
+                                                         journal=journal, resume_state=resume_state, metrics=metrics)
+    print(f"Rendered {rendered - len(failures)} structures" + (f", {len(failures)} failed" if failures else ""))
+    if shard is not None:
+        manifest["complete"] = True
+        manifest["failures"] = len(failures)
+        write_shard_manifest(manifest_path, manifest)
+        print(f"Shard {shard[0]}/{shard[1]} finished. Once all shards are done, run: python src/merge_shards.py {final_pdf_path}")
+
+    # Remove temporaty directory with all images and pdf pages. Watch mode still needs them.
+    if not SETTINGS["keep_png_pse_files"] and not args.watch and os.path.exists(temp_directory) and not (in_memory and SETTINGS["in_memory_images"]["keep_png"]):
         shutil.rmtree(temp_directory)
 
+    # Run summary
+    if SETTINGS["render_cache"]["enabled"]:
+        evicted = evict_least_recently_used(SETTINGS["render_cache"]["directory"], SETTINGS["render_cache"]["max_size_mb"])
+        print(f"Render cache: {cache_hits} hits, {rendered - cache_hits} misses, {evicted} evicted ({SETTINGS['render_cache']['directory']})")
+    else:
+        print("Render cache: disabled")
+    if metrics.enabled:
+        metrics_path = os.path.splitext(output_pdf_path)[0] + "_metrics.json"
+        metrics.print_summary(metrics.write_report(metrics_path), metrics_path)
+
+    if args.watch:
+        watch_input_folder(args.input_folder, temp_directory, output_pdf_path, SETTINGS, license_file_path, journal)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,133 @@
+import os
+import hashlib
+import inspect
+import json
+import shutil
+from pdb_to_png import get_pymol_script
+from structure_io import split_member_path, read_raw_bytes
+
+
+# Settings that change how an image looks. Anything else (grid, pdf settings, ...) does not invalidate the cache.
+RENDER_SETTINGS_KEYS = ("pymol_settings", "image_dimensions", "pymol_script", "level_of_detail")
+
+
+def get_render_cache_directory(SETTINGS):
+    """Returns the render cache directory, defaulting to .render_cache inside the output directory."""
+    cache_directory = SETTINGS["render_cache"]["directory"]
+    if cache_directory is None:
+        cache_directory = os.path.join(SETTINGS["output_directory"], ".render_cache")
+    return cache_directory
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_structure(path):
+    """Hashes a structure file, or the stored bytes of an archive member (see structure_io)."""
+    if split_member_path(path)[1] is None:
+        return hash_file(path)
+    return hashlib.sha256(read_raw_bytes(path)).hexdigest()
+
+
+def render_cache_key(pdb_path, SETTINGS):
+    """
+    Builds the cache key of a rendered image.
+
+    The key is a hash of the PDB contents, the render-relevant settings and the
+    source code of the chosen pymol script, so editing the script invalidates old images.
+    """
+    pymol_script = get_pymol_script(SETTINGS)
+    try:
+        script_source = inspect.getsource(pymol_script)
+    except (OSError, TypeError):
+        script_source = pymol_script.__name__
+    render_settings = {key: SETTINGS.get(key) for key in RENDER_SETTINGS_KEYS}
+
+    digest = hashlib.sha256()
+    digest.update(hash_structure(pdb_path).encode())
+    digest.update(json.dumps(render_settings, sort_keys=True).encode())
+    digest.update(script_source.encode())
+    return digest.hexdigest()
+
+
+def view_cache_key(key, view):
+    """Cache key of one view (see pdb_to_png.get_views) of the structure with cache key key."""
+    return hashlib.sha256((key + json.dumps(view, sort_keys=True)).encode()).hexdigest()
+
+
+def cached_image_path(cache_directory, key):
+    return os.path.join(cache_directory, key[:2], key + ".png")
+
+
+def lookup_cached_image(cache_directory, key, output_path):
+    """Places the cached image for key at output_path. Returns False on a cache miss."""
+    cached_path = cached_image_path(cache_directory, key)
+    try:
+        # Touching the entry marks it as recently used for LRU eviction.
+        os.utime(cached_path)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        # Images in _source_files are only ever replaced, never written into (see pdb_to_png.write_image_file), so the link cannot change the cache entry.
+        try:
+            os.link(cached_path, output_path)
+        except OSError:
+            shutil.copyfile(cached_path, output_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def read_cached_image(cache_directory, key):
+    """Returns the PNG bytes cached for key, or None on a cache miss."""
+    cached_path = cached_image_path(cache_directory, key)
+    try:
+        os.utime(cached_path)
+        with open(cached_path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def store_cached_image(cache_directory, key, png_data):
+    """Adds a freshly rendered PNG to the cache. Writes are atomic so concurrent workers never see partial files."""
+    cached_path = cached_image_path(cache_directory, key)
+    os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+    temp_path = f"{cached_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(png_data)
+    os.replace(temp_path, cached_path)
+
+
+def evict_least_recently_used(cache_directory, max_size_mb):
+    """Deletes the least recently used images until the cache fits in max_size_mb. Returns the number of evicted images."""
+    if max_size_mb is None or not os.path.isdir(cache_directory):
+        return 0
+
+    entries = []
+    total_size = 0
+    for shard in os.scandir(cache_directory):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            if entry.name.endswith(".png"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+    max_size = max_size_mb * 1024 * 1024
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+        evicted += 1
+    return evicted
@@ -0,0 +1,144 @@
+import os
+import hashlib
+import json
+import threading
+
+
+# Settings that do not change the output PDF. A run may be resumed with different values.
+RESUMABLE_SETTINGS_KEYS = ("worker_pool", "render_cache", "in_memory_images", "keep_png_pse_files", "discovery_index", "run_journal", "metrics", "watch", "pymol_license_file")
+
+
+def run_fingerprint(SETTINGS, input_path, output_pdf_path):
+    """Identifies a run by everything that determines its output, so --resume refuses to continue a different run."""
+    output_settings = {key: value for key, value in SETTINGS.items() if key not in RESUMABLE_SETTINGS_KEYS}
+    output_settings["pdf_settings"] = {key: value for key, value in SETTINGS["pdf_settings"].items() if key != "layout_processes"}
+    digest = hashlib.sha256(json.dumps(output_settings, sort_keys=True).encode()).hexdigest()
+    return {"settings": digest, "input": os.path.abspath(input_path), "output_pdf_path": os.path.abspath(output_pdf_path)}
+
+
+class RunJournal:
+    """
+    Records the progress of a run in the _source_files directory, so an interrupted run can be resumed.
+
+    run_journal.jsonl holds one JSON record per line: the run fingerprint, rendered
+    images, finished pages (with the PDF writer checkpoint) and the end of the run.
+    selection.txt holds the selected PDB files in PDF order. Both files are only
+    appended to, and a line cut short by a crash is ignored when loading.
+
+    Watch mode (see watch.py) appends updates: new files are added to the selection,
+    changed files lose their rendered image and the pages from the first affected one
+    are written again, replacing the pages recorded before.
+    """
+
+    def __init__(self, directory):
+        self.journal_path = os.path.join(directory, "run_journal.jsonl")
+        self.selection_path = os.path.join(directory, "selection.txt")
+        self.journal_file = None
+        self.selection_file = None
+        # The selection is recorded from the pool's task feeder thread, everything else from the main thread.
+        self.lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.journal_path)
+
+    def start(self, fingerprint):
+        """Starts a new journal, discarding the journal of any previous run."""
+        self.journal_file = open(self.journal_path, "w", buffering=1)
+        self.selection_file = open(self.selection_path, "w", buffering=1)
+        self.write_record({"type": "run", **fingerprint})
+
+    def reopen(self):
+        """Continues appending to the journal of an interrupted run."""
+        self.journal_file = open(self.journal_path, "a", buffering=1)
+        self.selection_file = open(self.selection_path, "a", buffering=1)
+
+    def load(self):
+        """
+        Reads the journal of a previous run.
+
+        Returns:
+        - dict: fingerprint, selection (List[str]), selection_complete, rendered
+          (Dict[int, str] of image paths by selection index), pages (List[dict]) and finished.
+        """
+        state = {"fingerprint": None, "selection": [], "selection_complete": False, "rendered": {}, "pages": [], "finished": False}
+        with open(self.journal_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # cut short by a crash
+                record_type = record.pop("type")
+                if record_type == "run":
+                    state["fingerprint"] = record
+                elif record_type == "selection_complete":
+                    state["selection_complete"] = True
+                elif record_type == "render":
+                    if record["image_path"] is None:
+                        state["rendered"].pop(record["index"], None)  # the file changed, render it again
+                    else:
+                        state["rendered"][record["index"]] = record["image_path"]
+                elif record_type == "page":
+                    del state["pages"][record["page"]:]  # pages written again replace the old ones
+                    state["pages"].append(record)
+                elif record_type == "update":
+                    del state["pages"][record["first_page"]:]
+                    state["finished"] = False
+                elif record_type == "finished":
+                    state["finished"] = True
+
+        with open(self.selection_path, "r") as f:
+            lines = f.read().split("\n")
+        # The last element is either empty or a line cut short by a crash.
+        state["selection"] = lines[:-1]
+        return state
+
+    def write_record(self, record, sync=False):
+        with self.lock:
+            self.journal_file.write(json.dumps(record) + "\n")
+            if sync:
+                os.fsync(self.journal_file.fileno())
+
+    def record_selection(self, pdb_files, already_recorded=0):
+        """Yields pdb_files, appending every file after the first already_recorded ones to selection.txt."""
+        count = 0
+        for pdb_file in pdb_files:
+            if count >= already_recorded:
+                self.selection_file.write(pdb_file + "\n")
+            count += 1
+            yield pdb_file
+        self.write_record({"type": "selection_complete", "count": count})
+
+    def continue_selection(self, pdb_files, recorded_selection):
+        """Yields pdb_files, checking that they start with the selection recorded by the interrupted run."""
+        for index, pdb_file in enumerate(pdb_files):
+            if index < len(recorded_selection) and pdb_file != recorded_selection[index]:
+                raise ValueError(f"The files selected now differ from the interrupted run at {pdb_file}. "
+                                 "Did the input change or was the run started without --seed?")
+            yield pdb_file
+
+    def record_render(self, index, image_path):
+        self.write_record({"type": "render", "index": index, "image_path": image_path})
+
+    def start_update(self, first_page, new_files, changed_indices):
+        """Records a watch mode update: pages from first_page on are written again, new_files are appended to the selection and the files at changed_indices are rendered again."""
+        self.write_record({"type": "update", "first_page": first_page}, sync=True)
+        for index in changed_indices:
+            self.record_render(index, None)
+        for pdb_file in new_files:
+            self.selection_file.write(pdb_file + "\n")
+
+    def record_page(self, page_index, **page_state):
+        """Records a finished page. Synced to disk, as resuming relies on pages being complete."""
+        os.fsync(self.selection_file.fileno())
+        self.write_record({"type": "page", "page": page_index, **page_state}, sync=True)
+
+    def finish(self):
+        self.write_record({"type": "finished"}, sync=True)
+        self.close()
+
+    def close(self):
+        for f in (self.journal_file, self.selection_file):
+            if f is not None:
+                f.close()
+        self.journal_file = None
+        self.selection_file = None
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import resource
+import statistics
+from contextlib import contextmanager
+
+
+# Upper bounds (ms) of the latency histogram buckets. Slower structures fall in a final "inf" bucket.
+HISTOGRAM_BUCKETS_MS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+# Per-structure steps, in the order they run (see process_pdb_file and generate_image_from_pdb).
+STRUCTURE_STEPS = ("cache", "load", "style", "render", "write", "decode", "total")
+
+
+def timed_call(func, *args):
+    """Calls func(*args) and returns (seconds, result). Used to time work done in pool processes."""
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of its finished child processes. ru_maxrss is in KiB on Linux."""
+    return {
+        "main": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "workers": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def summarise_latencies(seconds):
+    """Count, mean, percentiles and a histogram of a list of latencies, in ms."""
+    latencies_ms = sorted(s * 1000 for s in seconds)
+    histogram = {f"<={bound}": 0 for bound in HISTOGRAM_BUCKETS_MS}
+    histogram["inf"] = 0
+    for latency in latencies_ms:
+        for bound in HISTOGRAM_BUCKETS_MS:
+            if latency <= bound:
+                histogram[f"<={bound}"] += 1
+                break
+        else:
+            histogram["inf"] += 1
+    return {
+        "count": len(latencies_ms),
+        "mean_ms": statistics.mean(latencies_ms),
+        "p50_ms": latencies_ms[int(0.50 * (len(latencies_ms) - 1))],
+        "p95_ms": latencies_ms[int(0.95 * (len(latencies_ms) - 1))],
+        "max_ms": latencies_ms[-1],
+        "histogram": histogram,
+    }
+
+
+class RunMetrics:
+    """
+    Collects timings of a run: wall time per stage, per-structure step latencies,
+    worker utilisation and peak memory.
+
+    Stages are timed in the main process with stage() and add_time(). Per-structure
+    timings are measured in the workers and arrive with each result (record_structure).
+    """
+
+    enabled = True
+
+    def __init__(self, SETTINGS):
+        self.SETTINGS = SETTINGS
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.structures = []
+        self.failed = 0
+        self.cache_hits = 0
+        self.resumed = 0
+
+    def add_time(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed_iter(self, stage, iterable):
+        """Yields from iterable, adding the time spent producing each item to stage (e.g. lazy discovery)."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(stage, time.perf_counter() - start)
+                return
+            self.add_time(stage, time.perf_counter() - start)
+            yield item
+
+    def record_structure(self, result):
+        if result["error"]:
+            self.failed += 1
+        elif result["resumed"]:
+            self.resumed += 1
+        elif result["timings"] is not None:
+            self.cache_hits += result["cache_hit"]
+            self.structures.append((result["pdb_file"], result["timings"]))
+
+    def report(self):
+        """Returns the metrics as a JSON-serialisable dict."""
+        wall_seconds = time.perf_counter() - self.start
+        report = {
+            "wall_seconds": wall_seconds,
+            "stages_seconds": self.stages,
+            "structures": {"timed": len(self.structures), "cache_hits": self.cache_hits, "resumed": self.resumed, "failed": self.failed},
+            "steps": {},
+            "slowest": [],
+            "workers": {},
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        if not self.structures:
+            return report
+
+        for step in STRUCTURE_STEPS:
+            seconds = [timings[step] for _, timings in self.structures if step in timings]
+            if seconds:
+                report["steps"][step] = summarise_latencies(seconds)
+
+        slowest = sorted(self.structures, key=lambda structure: structure[1]["total"], reverse=True)
+        report["slowest"] = [
+            {"pdb_file": pdb_file, **{step: timings[step] * 1000 for step in STRUCTURE_STEPS if step in timings}}
+            for pdb_file, timings in slowest[:self.SETTINGS["metrics"]["slowest"]]
+        ]
+
+        # Utilisation: the share of the render stage each worker process spent on structures.
+        busy_by_worker = {}
+        for _, timings in self.structures:
+            busy_by_worker[timings["worker"]] = busy_by_worker.get(timings["worker"], 0) + timings["total"]
+        render_seconds = self.stages.get("render", wall_seconds)
+        processes = self.SETTINGS["worker_pool"]["processes"] or os.cpu_count()
+        report["workers"] = {
+            "processes": processes,
+            "worker_processes_used": len(busy_by_worker),
+            "busy_seconds": sum(busy_by_worker.values()),
+            "utilisation": sum(busy_by_worker.values()) / (render_seconds * processes) if render_seconds else None,
+        }
+        return report
+
+    def write_report(self, path):
+        report = self.report()
+        with open(path, "w") as f:
+            json.dump(report, f, indent=4)
+        return report
+
+    def print_summary(self, report, path):
+        stages = ", ".join(f"{stage} {seconds:.1f} s" for stage, seconds in report["stages_seconds"].items())
+        print(f"Metrics: {report['wall_seconds']:.1f} s total ({stages})")
+        if "total" in report["steps"]:
+            step_means = ", ".join(f"{step} {summary['mean_ms']:.0f}" for step, summary in report["steps"].items() if step != "total")
+            total = report["steps"]["total"]
+            print(f"Per structure: mean {total['mean_ms']:.0f} ms, p95 {total['p95_ms']:.0f} ms, max {total['max_ms']:.0f} ms "
+                  f"(mean ms: {step_means})")
+            print(f"Slowest: {report['slowest'][0]['pdb_file']} ({report['slowest'][0]['total']:.0f} ms)")
+        if report["workers"].get("utilisation") is not None:
+            print(f"Worker utilisation: {100 * report['workers']['utilisation']:.0f}% of {report['workers']['processes']} processes")
+        print(f"Peak RSS: main {report['peak_rss_mb']['main']:.0f} MB, workers {report['peak_rss_mb']['workers']:.0f} MB. Report: {path}")
+
+
+class NullMetrics:
+    """Stands in for RunMetrics when metrics are disabled. Every call does nothing."""
+
+    enabled = False
+
+    def add_time(self, stage, seconds):
+        pass
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def timed_iter(self, stage, iterable):
+        return iterable
+
+    def record_structure(self, result):
+        pass
+
+
+def create_metrics(SETTINGS):
+    """Returns a RunMetrics, or a NullMetrics if metrics.enabled is off."""
+    if SETTINGS["metrics"]["enabled"]:
+        return RunMetrics(SETTINGS)
+    return NullMetrics()
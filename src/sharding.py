@@ -0,0 +1,52 @@
+import os
+import math
+import hashlib
+import json
+
+
+def parse_shard(text):
+    """Parses "i/N" (shard i of N, counting from 0) into (i, N)."""
+    try:
+        shard, shards = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"--shard must look like i/N, e.g. 0/4, not '{text}'")
+    if shards < 1 or not 0 <= shard < shards:
+        raise ValueError(f"--shard {text}: i must be between 0 and N-1")
+    return shard, shards
+
+
+def shard_page_range(structures, structures_per_page, shard, shards):
+    """
+    Returns the [first, last) pages rendered by shard out of shards.
+
+    Shards get contiguous, nearly equal page ranges, so every shard starts on a page
+    boundary and the pages are the same as in a single run, whatever the number of shards.
+    """
+    pages = math.ceil(structures / structures_per_page)
+    return shard * pages // shards, (shard + 1) * pages // shards
+
+
+def shard_paths(output_pdf_path, shard, shards):
+    """Returns the PDF and manifest paths of a shard, next to the final PDF."""
+    base = f"{os.path.splitext(output_pdf_path)[0]}_shard_{shard}_of_{shards}"
+    return base + ".pdf", base + ".json"
+
+
+def selection_digest(pdb_files):
+    """Hash of the selected files in order. Every shard of a run must select the same files."""
+    digest = hashlib.sha256()
+    for pdb_file in pdb_files:
+        digest.update(pdb_file.encode() + b"\n")
+    return digest.hexdigest()
+
+
+def write_shard_manifest(path, manifest):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(temp_path, path)
+
+
+def load_shard_manifest(path):
+    with open(path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,132 @@
+import os
+import io
+import gzip
+import struct
+import tarfile
+from functools import lru_cache
+
+
+# Structure files read by pymol, with or without gzip compression.
+STRUCTURE_EXTENSIONS = (".pdb", ".pdb.gz", ".cif", ".cif.gz")
+
+# Tar shards holding many structure files. Their members are read in place, never extracted.
+ARCHIVE_EXTENSIONS = (".tar", ".tar.gz", ".tgz")
+
+# Separates an archive from one of its members, e.g. designs_0001.tar::model_17.cif.gz
+MEMBER_SEPARATOR = "::"
+
+
+def split_member_path(path):
+    """Returns (archive path, member name) for an archive member, or (path, None) for a plain file."""
+    if MEMBER_SEPARATOR in path:
+        archive_path, member_name = path.split(MEMBER_SEPARATOR, 1)
+        return archive_path, member_name
+    return path, None
+
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def is_structure_file(path):
+    return path.lower().endswith(STRUCTURE_EXTENSIONS)
+
+
+def structure_name(path):
+    """The name of a structure without directories and extensions, e.g. model_17 for shard.tar::run/model_17.cif.gz."""
+    name = os.path.basename(split_member_path(path)[1] or path)
+    for extension in STRUCTURE_EXTENSIONS:
+        if name.lower().endswith(extension):
+            return name[:-len(extension)]
+    return os.path.splitext(name)[0]
+
+
+def structure_format(path):
+    """The pymol format name of a structure file: pdb or cif."""
+    name = (split_member_path(path)[1] or path).lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return "cif" if name.endswith(".cif") else "pdb"
+
+
+def archive_members(archive_path):
+    """
+    Indexes the structure files in a tar archive: member name -> (data offset, size).
+
+    Reading the headers once per process makes every member of an uncompressed tar
+    a single seek and read. Members of compressed tars can only be reached by
+    decompressing from the start, so uncompressed tars of compressed members are faster.
+    """
+    stat = os.stat(archive_path)
+    # The archive's mtime and size are part of the cache key, so an archive that grows is indexed again.
+    return index_archive(archive_path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=64)
+def index_archive(archive_path, mtime_ns, size):
+    with tarfile.open(archive_path, "r:*") as archive:
+        return {member.name: (member.offset_data, member.size)
+                for member in archive if member.isfile() and is_structure_file(member.name)}
+
+
+def iter_archive_members(archive_path):
+    """Yields the paths (archive::member) of the structure files in a tar archive, in archive order."""
+    for member_name in archive_members(archive_path):
+        yield f"{archive_path}{MEMBER_SEPARATOR}{member_name}"
+
+
+def read_raw_bytes(path):
+    """Returns the stored bytes of a structure, still compressed if it is gzipped."""
+    archive_path, member_name = split_member_path(path)
+    if member_name is None:
+        with open(path, "rb") as f:
+            return f.read()
+    if member_name not in archive_members(archive_path):
+        raise FileNotFoundError(f"{member_name} is not a structure file in {archive_path}")
+    if archive_path.lower().endswith(".tar"):
+        offset, size = archive_members(archive_path)[member_name]
+        with open(archive_path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+    with tarfile.open(archive_path, "r:*") as archive:
+        return archive.extractfile(member_name).read()
+
+
+def read_structure(path):
+    """
+    Returns the contents of a structure file or archive member as text, decompressed in memory.
+
+    Decoded as latin-1, which maps every byte to one character, so non-UTF-8 bytes (e.g. in
+    REMARK lines) load like they do from a plain file instead of failing the structure.
+    """
+    data = read_raw_bytes(path)
+    if (split_member_path(path)[1] or path).lower().endswith(".gz"):
+        data = gzip.decompress(data)
+    return data.decode("latin-1")
+
+
+def structure_exists(path):
+    archive_path, member_name = split_member_path(path)
+    if member_name is None:
+        return os.path.exists(path)
+    return os.path.exists(archive_path) and member_name in archive_members(archive_path)
+
+
+def structure_size(path):
+    """
+    The uncompressed size of a structure in bytes, a cheap proxy for its atom count.
+
+    For a gzipped file this is read from the gzip trailer, without decompressing.
+    """
+    try:
+        archive_path, member_name = split_member_path(path)
+        if member_name is not None:
+            return archive_members(archive_path)[member_name][1]
+        if not path.lower().endswith(".gz"):
+            return os.path.getsize(path)
+        with open(path, "rb") as f:
+            f.seek(-4, io.SEEK_END)
+            # The last 4 bytes of a gzip file hold the uncompressed size modulo 2**32.
+            return struct.unpack("<I", f.read(4))[0]
+    except (OSError, KeyError, tarfile.TarError):
+        return 0
@@ -0,0 +1,258 @@
+import os
+import math
+import time
+import ctypes
+import ctypes.util
+import struct
+from discovery import DISCOVERY_EXTENSIONS, iter_structure_files, iter_structure_archive
+from helpers import structures_per_page
+from pipeline import run_render_pipeline
+from render_cache import evict_least_recently_used
+from structure_io import split_member_path, is_archive
+
+
+# inotify(7) event flags
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len, followed by the name
+
+
+class InotifyWatcher:
+    """
+    Collects the files written or moved into a folder tree, from Linux inotify through ctypes.
+
+    Every directory is watched once, and a poll only reads the pending events, so
+    it costs the same however many files the tree holds. Directories created
+    later are watched as they appear. Raises OSError if inotify is not available.
+    """
+
+    def __init__(self, root):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify is not available on this platform")
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.root = root
+        self.directories = {}  # watch descriptor -> directory
+        try:
+            self.watch_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def watch_tree(self, top):
+        """Watches top and its subdirectories and returns the files already in them."""
+        files = []
+        for directory, subdirectories, names in os.walk(top):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                # ENOSPC means fs.inotify.max_user_watches is too low for the tree
+                raise OSError(errno, f"cannot watch {directory}: {os.strerror(errno)}")
+            self.directories[wd] = directory
+            files.extend(os.path.join(directory, name) for name in names)
+        return files
+
+    def read_changes(self):
+        """
+        Returns the files written or moved into the tree since the last call, or None if
+        events were lost (the kernel queue overflowed) and the tree must be scanned again.
+        """
+        data = b""
+        while True:
+            try:
+                data += os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+        files = []
+        overflow = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0"))
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+            elif mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+            elif wd in self.directories:
+                path = os.path.join(self.directories[wd], name)
+                if mask & IN_ISDIR:
+                    # Files may land in a new directory before it is watched, so they are taken from its listing
+                    if mask & (IN_CREATE | IN_MOVED_TO) and not os.path.islink(path):
+                        files.extend(self.watch_tree(path))
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    files.append(path)
+        if overflow:
+            # Directories created while events were lost have no watch yet. Watching the whole
+            # tree again adds theirs, and inotify keeps the existing watches as they are.
+            self.watch_tree(self.root)
+            return None
+        return files
+
+    def close(self):
+        os.close(self.fd)
+
+
+def file_signature(path):
+    """(mtime_ns, size) of a file, or None if it is gone."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def discovery_order(path, root):
+    """Sort key that puts files in the order iter_structure_files finds them: files before subdirectories, both sorted by name."""
+    parts = os.path.relpath(path, root).split(os.sep)
+    return [(1, part) for part in parts[:-1]] + [(0, parts[-1])]
+
+
+def changed_structures(paths, SETTINGS, signatures):
+    """
+    Returns the structure files in the files at paths whose file_signature is not the one
+    in signatures, and updates signatures. Every member of a changed archive counts as
+    changed, and the archives that did not change are not opened.
+    """
+    filename_pattern = SETTINGS["filename_pattern"] or ""
+    changed = []
+    for path in paths:
+        signature = file_signature(path)
+        if signature is None or signatures.get(path) == signature:
+            continue
+        signatures[path] = signature
+        if is_archive(path):
+            changed.extend(member_path for member_path in iter_structure_archive(path)
+                           if filename_pattern in os.path.basename(member_path))
+        elif filename_pattern in os.path.basename(path):
+            changed.append(path)
+    return changed
+
+
+def scan_for_changes(input_folder, SETTINGS, index_path, signatures, watcher=None):
+    """
+    Returns the new and changed structure files under input_folder in discovery order,
+    and updates signatures (file_signature by file on disk) with them.
+
+    With a watcher, only the files it saw being written are checked. Without one, or if
+    it lost events, the whole tree is walked: the discovery index keeps the walk cheap, as
+    only directories whose mtime changed are listed again, but every file is still checked
+    with os.stat, so files rewritten in place are noticed too.
+    """
+    paths = watcher.read_changes() if watcher is not None else None
+    if paths is None:
+        paths = iter_structure_files(input_folder, SETTINGS["filename_pattern"], index_path=index_path, expand_archives=False)
+    else:
+        paths = sorted({path for path in paths if path.lower().endswith(DISCOVERY_EXTENSIONS)},
+                       key=lambda path: discovery_order(path, input_folder))
+    return changed_structures(paths, SETTINGS, signatures)
+
+
+def wait_for_changes(input_folder, SETTINGS, index_path, signatures, watcher=None, changed_files=()):
+    """
+    Polls input_folder until files change, then until nothing changed for debounce_seconds,
+    so files still being written and bursts of new files end up in one update.
+
+    changed_files are changes already found, which are returned together with the new ones.
+
+    Returns:
+    - List[str]: The new and changed files, in the order they were first seen.
+    """
+    changed = dict.fromkeys(changed_files)
+    last_change = time.monotonic()
+    while True:
+        time.sleep(SETTINGS["watch"]["poll_interval_seconds"])
+        found = scan_for_changes(input_folder, SETTINGS, index_path, signatures, watcher)
+        if found:
+            changed.update(dict.fromkeys(found))
+            last_change = time.monotonic()
+        if changed and time.monotonic() - last_change >= SETTINGS["watch"]["debounce_seconds"]:
+            return list(changed)
+
+
+def update_settings(SETTINGS, structures, pages):
+    """
+    SETTINGS for an update that renders structures and writes pages: no more pymol workers
+    and layout processes than there is work for, as both pools are started for every update.
+    """
+    processes = min(SETTINGS["worker_pool"]["processes"] or os.cpu_count(), max(1, structures))
+    layout_processes = min(SETTINGS["pdf_settings"]["layout_processes"], max(1, pages))
+    return {**SETTINGS,
+            "worker_pool": {**SETTINGS["worker_pool"], "processes": processes},
+            "pdf_settings": {**SETTINGS["pdf_settings"], "layout_processes": layout_processes}}
+
+
+def create_watcher(input_folder, SETTINGS):
+    """An InotifyWatcher for input_folder if watch.inotify is set and the platform supports it, else None to poll."""
+    if not SETTINGS["watch"]["inotify"]:
+        return None
+    try:
+        return InotifyWatcher(input_folder)
+    except (OSError, AttributeError) as e:
+        print(f"Cannot use inotify ({e}), polling {input_folder} instead")
+        return None
+
+
+def watch_input_folder(input_folder, temp_directory, output_pdf_path, SETTINGS, license_file_path, journal):
+    """
+    Keeps output_pdf_path up to date with input_folder until interrupted.
+
+    New files are appended after the files already in the PDF, and changed files are
+    rendered again in place. Only the pages from the first affected one are written
+    again: the PDF is cut back to that page's checkpoint (see StreamingPdfWriter) and
+    continued like a resumed run, reusing the images of unchanged files. Appending
+    new files therefore only rewrites the last page, whatever the size of the PDF.
+
+    The run journal records every update, so an interrupted update is continued with
+    --resume --watch. Changes to files already in the PDF made while not watching are
+    not noticed.
+    """
+    page_structures = structures_per_page(SETTINGS)
+    selection = journal.load()["selection"]
+    index_by_file = {pdb_file: index for index, pdb_file in enumerate(selection)}
+    signatures = {path: file_signature(path) for path in {split_member_path(pdb_file)[0] for pdb_file in selection}}
+    index_path = SETTINGS["discovery_index"] or os.path.join(temp_directory, "watch_discovery_index.json")
+    # Start watching before the first poll, so files written from now on are not missed
+    watcher = create_watcher(input_folder, SETTINGS)
+
+    print(f"Watching {input_folder} for new and changed files (Ctrl+C to stop)")
+    try:
+        # The watcher only sees what happens from now on, so files written during the first run are found by one full scan
+        pending_files = scan_for_changes(input_folder, SETTINGS, index_path, signatures) if watcher is not None else []
+        while True:
+            changed_files = wait_for_changes(input_folder, SETTINGS, index_path, signatures, watcher, pending_files)
+            pending_files = []
+            start = time.perf_counter()
+            new_files = [pdb_file for pdb_file in changed_files if pdb_file not in index_by_file]
+            changed_indices = sorted(index_by_file[pdb_file] for pdb_file in changed_files if pdb_file in index_by_file)
+            # New files go on the last page (and after), changed files rewrite their own page
+            first_page = min(changed_indices + ([len(selection)] if new_files else [])) // page_structures
+
+            journal.reopen()
+            journal.start_update(first_page, new_files, changed_indices)
+            for pdb_file in new_files:
+                index_by_file[pdb_file] = len(selection)
+                selection.append(pdb_file)
+            resume_state = journal.load()
+
+            last_page = math.ceil(len(selection) / page_structures)
+            print(f"{len(new_files)} new and {len(changed_indices)} changed files, writing pages {first_page + 1} to {last_page}")
+            rendered, cache_hits, failures = run_render_pipeline(selection, temp_directory, output_pdf_path,
+                                                                 update_settings(SETTINGS, len(new_files) + len(changed_indices), last_page - first_page),
+                                                                 license_file_path, journal=journal, resume_state=resume_state)
+            print(f"Updated {output_pdf_path} in {time.perf_counter() - start:.1f} s: {rendered - len(failures)} structures placed"
+                  + (f", {len(failures)} failed" if failures else "") + f", {cache_hits} render cache hits")
+            if SETTINGS["render_cache"]["enabled"]:
+                evict_least_recently_used(SETTINGS["render_cache"]["directory"], SETTINGS["render_cache"]["max_size_mb"])
+    except KeyboardInterrupt:
+        journal.close()
+        if watcher is not None:
+            watcher.close()
+        print("Stopped watching. Continue with --resume --watch")
@@ -0,0 +1,290 @@
+import math
+import os
+import io
+import time
+import heapq
+import multiprocessing
+import multiprocessing.connection
+from collections import deque
+from helpers import activate_license, process_pdb_file, iter_chunks, make_placeholder_png, prepare_tile
+from structure_io import structure_size
+from pdb_to_png import configure_pymol_cmd, get_views
+
+
+# Per-worker state set once by init_render_worker, so jobs only carry PDB paths.
+worker_settings = None
+worker_temp_directory = None
+
+
+def init_render_worker(SETTINGS, temp_directory, license_file_path):
+    """Pool initializer: activates the license and configures pymol once per worker process."""
+    global worker_settings, worker_temp_directory
+    if license_file_path is not None:
+        activate_license(license_file_path, quiet=True)
+    configure_pymol_cmd(SETTINGS)
+    worker_settings = SETTINGS
+    worker_temp_directory = temp_directory
+
+
+def render_batch(jobs):
+    """Renders a batch of (pdb_file, previous_image_path) jobs in a pre-initialised worker."""
+    return [process_pdb_file(pdb_file, worker_temp_directory, worker_settings, previous_image_path)
+            for pdb_file, previous_image_path in jobs]
+
+
+def get_pool_context(SETTINGS):
+    """Returns the multiprocessing context for the configured start method (fork, spawn, forkserver or the platform default)."""
+    return multiprocessing.get_context(SETTINGS["worker_pool"]["start_method"])
+
+
+def supervised_render_worker(connection, SETTINGS, temp_directory, license_file_path, max_structures):
+    """
+    Worker loop of the SupervisedRenderPool: renders one job at a time and sends back its result.
+
+    Python errors are reported to the supervisor. The worker exits after max_structures
+    structures (if set) and is replaced by the supervisor.
+    """
+    init_render_worker(SETTINGS, temp_directory, license_file_path)
+    connection.send(("ready", None, None))
+    structures = 0
+    while True:
+        job = connection.recv()
+        if job is None:
+            break
+        index, (pdb_file, previous_image_path) = job
+        try:
+            connection.send(("done", index, process_pdb_file(pdb_file, temp_directory, SETTINGS, previous_image_path)))
+        except Exception as e:
+            connection.send(("error", index, f"{type(e).__name__}: {e}"))
+        structures += 1
+        if max_structures and structures >= max_structures:
+            break
+    connection.close()
+
+
+def estimate_render_cost(pdb_file):
+    """Estimates how long pdb_file takes to render. The uncompressed size grows with the atom count and costs only a stat or a short read."""
+    return structure_size(pdb_file)
+
+
+class SupervisedRenderPool:
+    """
+    Pymol workers watched by the parent process, so one bad structure cannot stall or abort the run.
+
+    Every worker gets one structure at a time over its own pipe. A structure is
+    retried if it raises, crashes its worker (e.g. a pymol segfault) or exceeds
+    task_timeout_seconds. A worker that crashed or hung is killed and replaced by
+    a fresh one, a worker whose structure raised a Python error keeps running.
+    After max_retries retries it is given up: its result carries the error and a
+    placeholder tile.
+
+    With largest_first, the largest waiting structure (see estimate_render_cost) is
+    dispatched first, so big structures do not end up alone at the end of the run
+    while the other workers idle. Results are still yielded in the input order, so
+    structures are read ahead at most processes + schedule_window past the oldest
+    result not yielded yet. That leaves schedule_window structures to choose from
+    however many workers there are, and bounds the finished results held back, so
+    pages are still written (and journaled) while rendering continues.
+    """
+
+    def __init__(self, SETTINGS, temp_directory, license_file_path=None):
+        pool_settings = SETTINGS["worker_pool"]
+        self.SETTINGS = SETTINGS
+        self.temp_directory = temp_directory
+        self.license_file_path = license_file_path
+        self.context = get_pool_context(SETTINGS)
+        self.processes = pool_settings["processes"] or os.cpu_count()
+        self.timeout = pool_settings["task_timeout_seconds"]
+        self.max_retries = pool_settings["max_retries"]
+        self.largest_first = pool_settings["largest_first"]
+        # How far past the oldest result not yielded yet structures are read ahead
+        self.max_ahead = self.processes + max(pool_settings["schedule_window"], 1)
+        self.workers = [self.start_worker() for _ in range(self.processes)]
+        self.placeholder = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start_worker(self):
+        parent_connection, child_connection = self.context.Pipe()
+        process = self.context.Process(
+            target=supervised_render_worker,
+            args=(child_connection, self.SETTINGS, self.temp_directory, self.license_file_path,
+                  self.SETTINGS["worker_pool"]["max_structures_per_worker"]),
+            daemon=True,
+        )
+        process.start()
+        child_connection.close()
+        return {"process": process, "connection": parent_connection, "ready": False, "task": None, "started": None}
+
+    def stop_worker(self, worker, kill=False):
+        if kill:
+            worker["process"].kill()
+        worker["process"].join()
+        worker["connection"].close()
+
+    def close(self):
+        for worker in self.workers:
+            if worker["process"].is_alive() and worker["task"] is None and worker["ready"]:
+                try:
+                    worker["connection"].send(None)
+                except OSError:
+                    pass
+            else:
+                worker["process"].kill()
+        for worker in self.workers:
+            self.stop_worker(worker)
+        self.workers = []
+
+    def failed_result(self, job, error):
+        """The result of a structure that could not be rendered: the placeholder tile and the error."""
+        pdb_file = job[0]
+        print(f"Failed to render {pdb_file}: {error}")
+        if self.placeholder is None:
+            png_data = make_placeholder_png(self.SETTINGS)
+            image_path = None
+            if not self.SETTINGS["in_memory_images"]["enabled"]:
+                image_path = os.path.join(self.temp_directory, "render_failed_placeholder.png")
+                with open(image_path, "wb") as f:
+                    f.write(png_data)
+            # Every failed structure shares the same tile, which the PDF writer embeds only once.
+            image = prepare_tile(io.BytesIO(png_data), self.SETTINGS) if self.SETTINGS["in_memory_images"]["enabled"] else None
+            self.placeholder = (image_path, image)
+        image_path, image = self.placeholder
+        views = get_views(self.SETTINGS)
+        if views:
+            # One placeholder tile per view, so the structure keeps its place in the grid.
+            image_path = [image_path] * len(views) if image_path is not None else None
+            image = [image] * len(views) if image is not None else None
+        return {"pdb_file": pdb_file, "image_path": image_path, "image": image, "cache_hit": False, "resumed": False, "error": error, "timings": None}
+
+    def imap(self, jobs):
+        """Renders (pdb_file, previous_image_path) jobs and yields the results in the input order."""
+        jobs = enumerate(jobs)
+        jobs_exhausted = False
+        waiting = []  # heap of (-cost, index), or (0, index) to keep the input order
+        retries = deque()
+        attempts = {}
+        job_by_index = {}
+        results = {}
+        next_index = 0  # next result to yield
+        next_read = 0  # next job to read
+
+        def task_failed(worker, error):
+            index = worker["task"]
+            worker["task"] = None
+            if attempts[index] < self.max_retries:
+                attempts[index] += 1
+                retries.append(index)
+            else:
+                results[index] = self.failed_result(job_by_index.pop(index), error)
+
+        while True:
+            # Read ahead up to max_ahead past the next result to yield
+            while not jobs_exhausted and next_read < next_index + self.max_ahead:
+                try:
+                    index, job = next(jobs)
+                except StopIteration:
+                    jobs_exhausted = True
+                    break
+                next_read = index + 1
+                job_by_index[index] = job
+                attempts[index] = 0
+                heapq.heappush(waiting, (-estimate_render_cost(job[0]) if self.largest_first else 0, index))
+
+            # Hand out work to idle workers
+            for worker in self.workers:
+                if not worker["ready"] or worker["task"] is not None:
+                    continue
+                if retries:
+                    index = retries.popleft()
+                elif waiting:
+                    index = heapq.heappop(waiting)[1]
+                else:
+                    continue
+                worker["connection"].send((index, job_by_index[index]))
+                worker["task"] = index
+                worker["started"] = time.monotonic()
+
+            # Yield finished results in order
+            yielded = next_index in results
+            while next_index in results:
+                yield results.pop(next_index)
+                next_index += 1
+            if jobs_exhausted and not job_by_index:
+                return
+            if yielded:
+                continue  # the window moved on, read ahead before waiting
+
+            # Wait for a result, a worker exit or the next timeout
+            wait_timeout = None
+            if self.timeout:
+                deadlines = [worker["started"] + self.timeout for worker in self.workers if worker["task"] is not None]
+                if deadlines:
+                    wait_timeout = max(0, min(deadlines) - time.monotonic())
+            waitables = [worker["connection"] for worker in self.workers] + [worker["process"].sentinel for worker in self.workers]
+            multiprocessing.connection.wait(waitables, timeout=wait_timeout)
+
+            for position, worker in enumerate(self.workers):
+                replace = False
+                try:
+                    while worker["connection"].poll():
+                        status, index, payload = worker["connection"].recv()
+                        if status == "ready":
+                            worker["ready"] = True
+                        elif status == "done":
+                            worker["task"] = None
+                            results[index] = payload
+                            del job_by_index[index]
+                        else:
+                            task_failed(worker, payload)
+                except (EOFError, OSError):
+                    replace = True
+
+                if not replace and not worker["process"].is_alive():
+                    replace = True
+                if replace:
+                    if not worker["ready"]:
+                        raise RuntimeError(f"A pymol worker exited during startup (exit code {worker['process'].exitcode})")
+                    if worker["task"] is not None:
+                        task_failed(worker, f"worker process died (exit code {worker['process'].exitcode})")
+                    self.stop_worker(worker, kill=True)
+                    self.workers[position] = self.start_worker()
+                elif worker["task"] is not None and self.timeout and time.monotonic() - worker["started"] > self.timeout:
+                    task_failed(worker, f"timed out after {self.timeout} s")
+                    self.stop_worker(worker, kill=True)
+                    self.workers[position] = self.start_worker()
+
+
+def create_render_pool(SETTINGS, temp_directory, license_file_path=None):
+    """
+    Creates the pool of pymol workers.
+
+    Workers are initialised once (see init_render_worker) and replaced after
+    max_structures_per_worker structures to bound pymol's memory growth.
+    With worker_pool.supervised, the workers are watched by a SupervisedRenderPool.
+    """
+    pool_settings = SETTINGS["worker_pool"]
+    if pool_settings["supervised"]:
+        return SupervisedRenderPool(SETTINGS, temp_directory, license_file_path)
+    processes = pool_settings["processes"] or os.cpu_count()
+    max_structures = pool_settings["max_structures_per_worker"]
+    maxtasksperchild = math.ceil(max_structures / pool_settings["batch_size"]) if max_structures else None
+    return get_pool_context(SETTINGS).Pool(
+        processes,
+        initializer=init_render_worker,
+        initargs=(SETTINGS, temp_directory, license_file_path),
+        maxtasksperchild=maxtasksperchild,
+    )
+
+
+def imap_render(pool, jobs, batch_size):
+    """Renders (pdb_file, previous_image_path) jobs in batches of batch_size and yields the results in the input order."""
+    if isinstance(pool, SupervisedRenderPool):
+        yield from pool.imap(jobs)
+        return
+    for results in pool.imap(render_batch, iter_chunks(jobs, batch_size)):
+        yield from results
@@ -0,0 +1,27 @@
+import os
+import sys
+import subprocess
+import pytest
+
+repository_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+source_directory = os.path.join(repository_directory, "src")
+sys.path.insert(0, source_directory)
+sys.path.insert(0, os.path.join(repository_directory, "benchmarks"))
+
+from synthetic import make_structures  # noqa: E402
+
+
+def run_script(script, *arguments):
+    """Runs a script from src/ in a fresh interpreter, like a user would, and returns its output."""
+    result = subprocess.run([sys.executable, os.path.join(source_directory, script), *map(str, arguments)],
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+
+@pytest.fixture(scope="session")
+def structure_folder(tmp_path_factory):
+    """A folder of small synthetic structures of different sizes."""
+    folder = tmp_path_factory.mktemp("structures")
+    make_structures(str(folder), [100, 150, 200, 250, 300])
+    return folder
@@ -0,0 +1,17 @@
+from helpers import reservoir_sample
+
+
+def test_reservoir_sample_depends_only_on_the_seed():
+    items = [f"{i}.pdb" for i in range(1000)]
+    selected, found = reservoir_sample(items, 10, seed=7)
+    assert found == 1000
+    assert len(set(selected)) == 10
+    # A generator gives the same selection as a list
+    assert reservoir_sample(iter(items), 10, seed=7) == (selected, 1000)
+    assert reservoir_sample(items, 10, seed=8)[0] != selected
+
+
+def test_reservoir_sample_keeps_small_inputs_whole():
+    items = [f"{i}.pdb" for i in range(5)]
+    assert reservoir_sample(items, 10, seed=1) == (items, 5)
+    assert reservoir_sample(iter(items), None) == (items, 5)
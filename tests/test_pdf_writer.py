@@ -0,0 +1,70 @@
+import io
+import json
+from PIL import Image
+from PyPDF2 import PdfReader
+from pdf_writer import StreamingPdfWriter, prepare_pdf_image
+import pytest
+
+
+def make_images(count, size=32):
+    """count distinct prepared RGBA images."""
+    images = []
+    for i in range(count):
+        buffer = io.BytesIO()
+        Image.new("RGBA", (size, size), (40 * i % 256, 255 - 40 * i % 256, 90, 200)).save(buffer, "PNG")
+        buffer.seek(0)
+        images.append(prepare_pdf_image(buffer))
+    return images
+
+
+def write_pages(writer, images, first_page, last_page, checkpoints=None):
+    """Writes pages first_page to last_page, two images and a label each, recording a checkpoint after every page."""
+    for page in range(first_page, last_page):
+        writer.add_page()
+        writer.set_font_size(10)
+        for slot in range(2):
+            writer.image(images[(page + slot) % len(images)], 10 + 100 * slot, 20, 80, 80)
+            writer.text_box(f"page {page} slot {slot}", 10 + 100 * slot, 92, 80, 6)
+        writer.end_page()
+        if checkpoints is not None:
+            # Round trip through JSON, like the run journal
+            checkpoints.append(json.loads(json.dumps(writer.checkpoint())))
+
+
+@pytest.fixture(scope="module")
+def images():
+    return make_images(3)
+
+
+def test_output_parses_strictly(images, tmp_path):
+    path = tmp_path / "out.pdf"
+    with StreamingPdfWriter(str(path)) as writer:
+        write_pages(writer, images, 0, 5)
+        assert writer.page_count == 5
+
+    reader = PdfReader(str(path), strict=True)
+    assert len(reader.pages) == 5
+    assert "page 3 slot 1" in reader.pages[3].extract_text()
+    # Every distinct image is embedded once and shared by the pages showing it
+    image_ids = {xobject.idnum for page in reader.pages for xobject in page["/Resources"]["/XObject"].values()}
+    assert len(image_ids) == len(images)
+
+
+def test_resumed_output_is_byte_identical(images, tmp_path):
+    with StreamingPdfWriter(str(tmp_path / "whole.pdf")) as writer:
+        write_pages(writer, images, 0, 6)
+
+    path = tmp_path / "resumed.pdf"
+    checkpoints = []
+    writer = StreamingPdfWriter(str(path))
+    write_pages(writer, images, 0, 3, checkpoints)
+    # Interrupted halfway through page 4: its image and part of its content are already on disk
+    write_pages(writer, make_images(1, size=48), 3, 4)
+    writer.abort()
+
+    with StreamingPdfWriter(str(path), checkpoints=checkpoints) as writer:
+        assert writer.page_count == 3
+        write_pages(writer, images, 3, 6)
+
+    assert path.read_bytes() == (tmp_path / "whole.pdf").read_bytes()
+    assert len(PdfReader(str(path), strict=True).pages) == 6
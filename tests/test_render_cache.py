@@ -0,0 +1,40 @@
+import hashlib
+import os
+import shutil
+from conftest import run_script
+from synthetic import make_structures
+
+
+def source_images(output_directory, output_filename):
+    """md5 of every PNG in a run's _source_files by structure name."""
+    source_directory = os.path.join(output_directory, f"{output_filename}_source_files")
+    images = {}
+    for name in os.listdir(source_directory):
+        if name.endswith(".png"):
+            with open(os.path.join(source_directory, name), "rb") as f:
+                images[name.rsplit("_", 1)[0]] = hashlib.md5(f.read()).hexdigest()
+    return images
+
+
+def test_rendering_over_a_cache_hit_keeps_the_cache_entry(tmp_path):
+    input_folder = tmp_path / "structures"
+    make_structures(str(input_folder), [100, 400])
+    make_structures(str(tmp_path / "edits"), [700])
+    small = sorted(input_folder.iterdir())[0]
+    edited = next((tmp_path / "edits").iterdir())
+    original = tmp_path / "original.pdb"
+    shutil.copyfile(small, original)
+    arguments = ["--input_folder", input_folder, "--output_directory", tmp_path / "out", "--grid", "1", "2",
+                 "--num_files", "0", "--processes", "1", "--no_metrics"]
+
+    run_script("protein_visualiser.py", *arguments, "--output_filename", "a")
+    expected = source_images(tmp_path / "out", "a")
+    # The second run places the cached images in _source_files
+    run_script("protein_visualiser.py", *arguments, "--output_filename", "a")
+    # A cache miss renders the edited structure over the image placed from the cache
+    shutil.copyfile(edited, small)
+    run_script("protein_visualiser.py", *arguments, "--output_filename", "a")
+    shutil.copyfile(original, small)
+
+    run_script("protein_visualiser.py", *arguments, "--output_filename", "fresh")
+    assert source_images(tmp_path / "out", "fresh") == expected
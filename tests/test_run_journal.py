@@ -0,0 +1,58 @@
+from run_journal import RunJournal
+
+
+def start_journal(directory, selection):
+    journal = RunJournal(str(directory))
+    journal.start({"settings": "digest", "input": "/in", "output_pdf_path": "/out/run.pdf"})
+    assert list(journal.record_selection(iter(selection))) == selection
+    return journal
+
+
+def test_load_reads_the_recorded_run(tmp_path):
+    journal = start_journal(tmp_path, ["a.pdb", "b.pdb", "c.pdb"])
+    journal.record_render(0, "a.png")
+    journal.record_render(1, "b.png")
+    journal.record_page(0, end_offset=100)
+    journal.finish()
+
+    state = RunJournal(str(tmp_path)).load()
+    assert state["fingerprint"] == {"settings": "digest", "input": "/in", "output_pdf_path": "/out/run.pdf"}
+    assert state["selection"] == ["a.pdb", "b.pdb", "c.pdb"]
+    assert state["selection_complete"]
+    assert state["rendered"] == {0: "a.png", 1: "b.png"}
+    assert state["pages"] == [{"page": 0, "end_offset": 100}]
+    assert state["finished"]
+
+
+def test_load_ignores_a_record_cut_short_by_a_crash(tmp_path):
+    journal = start_journal(tmp_path, ["a.pdb", "b.pdb"])
+    journal.record_page(0, end_offset=100)
+    journal.close()
+    with open(journal.journal_path, "a") as f:
+        f.write('{"type": "page", "page": 1, "end_of')
+    with open(journal.selection_path, "a") as f:
+        f.write("c.p")
+
+    state = RunJournal(str(tmp_path)).load()
+    assert state["selection"] == ["a.pdb", "b.pdb"]
+    assert [page["page"] for page in state["pages"]] == [0]
+    assert not state["finished"]
+
+
+def test_load_applies_watch_updates(tmp_path):
+    journal = start_journal(tmp_path, ["a.pdb", "b.pdb", "c.pdb"])
+    for index, image_path in enumerate(["a.png", "b.png", "c.png"]):
+        journal.record_render(index, image_path)
+    journal.record_page(0, end_offset=100)
+    journal.record_page(1, end_offset=200)
+    journal.finish()
+
+    journal.reopen()
+    journal.start_update(1, ["d.pdb"], [2])
+    journal.close()
+
+    state = RunJournal(str(tmp_path)).load()
+    assert state["selection"] == ["a.pdb", "b.pdb", "c.pdb", "d.pdb"]
+    assert state["rendered"] == {0: "a.png", 1: "b.png"}
+    assert [page["page"] for page in state["pages"]] == [0]
+    assert not state["finished"]
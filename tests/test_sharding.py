@@ -0,0 +1,36 @@
+from PyPDF2 import PdfReader
+from conftest import run_script
+from sharding import parse_shard, shard_page_range
+import pytest
+
+
+def page_texts(pdf_path):
+    return [page.extract_text() for page in PdfReader(str(pdf_path), strict=True).pages]
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for text in ("4/4", "-1/4", "1", "a/b"):
+        with pytest.raises(ValueError):
+            parse_shard(text)
+
+
+def test_shard_page_ranges_cover_every_page_once():
+    for shards in (1, 2, 3, 7, 20):
+        ranges = [shard_page_range(95, 8, shard, shards) for shard in range(shards)]
+        assert ranges[0][0] == 0 and ranges[-1][1] == 12
+        assert all(ranges[i][1] == ranges[i + 1][0] for i in range(shards - 1))
+
+
+def test_shards_merge_into_the_single_node_pdf(structure_folder, tmp_path):
+    # Default settings, so metrics reports sit next to the shard manifests
+    arguments = ["--input_folder", structure_folder, "--output_directory", tmp_path, "--grid", "1", "2",
+                 "--seed", "1", "--processes", "1", "--no_render_cache"]
+    run_script("protein_visualiser.py", *arguments, "--output_filename", "single")
+    for shard in range(3):
+        run_script("protein_visualiser.py", *arguments, "--output_filename", "sharded", "--shard", f"{shard}/3")
+    assert (tmp_path / "sharded_shard_0_of_3_metrics.json").exists()
+
+    run_script("merge_shards.py", tmp_path / "sharded.pdf")
+    assert len(page_texts(tmp_path / "single.pdf")) == 3
+    assert page_texts(tmp_path / "sharded.pdf") == page_texts(tmp_path / "single.pdf")
@@ -0,0 +1,18 @@
+import gzip
+import tarfile
+from structure_io import read_structure
+
+PDB_TEXT = ("REMARK   1 AUTHOR J\xd6RG M\xdcLLER\n"
+            "ATOM      1  CA  ALA A   1       0.000   0.000   0.000  1.00  0.00           C\n"
+            "END\n")
+
+
+def test_structures_that_are_not_utf8_are_read(tmp_path):
+    data = PDB_TEXT.encode("latin-1")
+    (tmp_path / "plain.pdb").write_bytes(data)
+    (tmp_path / "packed.pdb.gz").write_bytes(gzip.compress(data))
+    with tarfile.open(tmp_path / "shard.tar", "w") as archive:
+        archive.add(tmp_path / "packed.pdb.gz", arcname="model_1.pdb.gz")
+
+    for path in ("plain.pdb", "packed.pdb.gz", "shard.tar::model_1.pdb.gz"):
+        assert read_structure(str(tmp_path / path)) == PDB_TEXT
@@ -0,0 +1,46 @@
+import os
+import pytest
+from cli import load_settings, default_config_path
+from watch import InotifyWatcher, update_settings
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    try:
+        watcher = InotifyWatcher(str(tmp_path))
+    except (OSError, AttributeError) as e:
+        pytest.skip(f"inotify is not available: {e}")
+    yield watcher
+    watcher.close()
+
+
+def test_new_directories_are_watched(watcher, tmp_path):
+    os.makedirs(tmp_path / "a" / "b")
+    (tmp_path / "a" / "b" / "early.pdb").write_text("x")
+    assert watcher.read_changes() == [str(tmp_path / "a" / "b" / "early.pdb")]
+    (tmp_path / "a" / "b" / "late.pdb").write_text("x")
+    assert watcher.read_changes() == [str(tmp_path / "a" / "b" / "late.pdb")]
+
+
+def test_directories_created_while_events_were_lost_are_watched(watcher, tmp_path):
+    with open("/proc/sys/fs/inotify/max_queued_events") as f:
+        max_queued_events = int(f.read())
+    for i in range(max_queued_events + 1):
+        (tmp_path / f"{i}.pdb").touch()
+    os.makedirs(tmp_path / "lost")
+    assert watcher.read_changes() is None
+
+    (tmp_path / "lost" / "new.pdb").write_text("x")
+    assert watcher.read_changes() == [str(tmp_path / "lost" / "new.pdb")]
+
+
+def test_updates_only_start_the_processes_they_need():
+    SETTINGS = load_settings(default_config_path)
+    SETTINGS["worker_pool"]["processes"] = 16
+    SETTINGS["pdf_settings"]["layout_processes"] = 4
+    settings = update_settings(SETTINGS, 1, 1)
+    assert settings["worker_pool"]["processes"] == 1
+    assert settings["pdf_settings"]["layout_processes"] == 1
+    assert update_settings(SETTINGS, 100, 8)["worker_pool"]["processes"] == 16
+    # The run's own settings are left as they are
+    assert SETTINGS["worker_pool"]["processes"] == 16
@@ -0,0 +1,25 @@
+import os
+from cli import load_settings, default_config_path
+from synthetic import make_structures
+from worker_pool import SupervisedRenderPool
+
+
+def test_results_are_not_held_back_for_the_whole_selection(tmp_path):
+    SETTINGS = load_settings(default_config_path)
+    SETTINGS["worker_pool"].update({"processes": 1, "schedule_window": 2, "largest_first": True})
+    SETTINGS["render_cache"]["enabled"] = False
+    # Smallest first, the worst order for largest-first scheduling
+    make_structures(str(tmp_path / "structures"), [100 + 50 * i for i in range(12)])
+    jobs = [(str(path), None) for path in sorted((tmp_path / "structures").iterdir())]
+    images = tmp_path / "images"
+    images.mkdir()
+
+    with SupervisedRenderPool(SETTINGS, str(images)) as pool:
+        results = pool.imap(jobs)
+        first = next(results)
+        rendered_before_first = len(os.listdir(images))
+        rest = list(results)
+
+    assert [result["pdb_file"] for result in [first] + rest] == [pdb_file for pdb_file, _ in jobs]
+    # At most processes + schedule_window structures are read ahead of the first result
+    assert rendered_before_first <= 3